@@ -0,0 +1,93 @@
+"""Cache van de antwoorden op de callbacks van het dashboard, als gecomprimeerde bytes.
+
+Dezelfde keuze (Functie, head count/FTE) wordt door veel gebruikers steeds
+opnieuw gevraagd. Het antwoord op _dash-update-component hangt alleen af van de
+versie van de data en de code en van de invoer, dus wordt het eenmaal bewaard,
+als JSON en gecomprimeerd met brotli. Een herhaling slaat de callback, het maken
+van de JSON en het comprimeren over.
+
+Elk antwoord krijgt een ETag uit de versie en de invoer. Stuurt een client die
+mee in If-None-Match, dan krijgt hij 304 zonder body.
+
+    import antwoorden
+
+    antwoorden.koppel(app.server, versie=lambda: figuren_versie)
+"""
+
+import hashlib
+import json
+
+import brotli
+from flask import Response, g, request
+
+from cache import LRUCache
+
+PAD = "/_dash-update-component"
+
+
+def etag(versie, body):
+    """ETag van een callback: de versie en de output en waarden van de invoer."""
+    invoer = {sleutel: body.get(sleutel) for sleutel in ("output", "inputs", "state")}
+    tekst = json.dumps([versie, invoer], sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(tekst.encode(), digest_size=16).hexdigest()
+
+
+def _antwoord(opgeslagen, tag, response=None):
+    """Het bewaarde antwoord, gecomprimeerd als de client brotli kent. In response
+    (het antwoord van Dash, met zijn headers) of een nieuwe. De grootte van de JSON
+    komt in g, voor de metingen van metrics.py."""
+    ruw, br = opgeslagen
+    g.ongecomprimeerd = len(ruw)
+    if response is None:
+        response = Response(mimetype="application/json")
+    if "br" in request.accept_encodings:
+        response.set_data(br)
+        response.headers["Content-Encoding"] = "br"
+    else:
+        response.set_data(ruw)
+    response.vary.add("Accept-Encoding")
+    response.set_etag(tag)
+    return response
+
+
+def koppel(server, versie, overslaan=lambda: False, maxsize=128):
+    """Zet de cache op de Flask server. versie() geeft de versie van de data en de
+    code; met overslaan() gaat een request buiten de cache om (bijv. profileren).
+    Geeft de cache terug, met als keys (versie, ETag): voor de hits en misses op
+    /metrics en om na een nieuwe versie op te ruimen."""
+    cache = LRUCache(maxsize=maxsize)
+
+    @server.before_request
+    def uit_cache():
+        if request.method != "POST" or not request.path.endswith(PAD) or overslaan():
+            return None
+        v = versie()
+        tag = etag(v, request.get_json(silent=True) or {})
+        if request.if_none_match.contains(tag):
+            response = Response(status=304)
+            response.set_etag(tag)
+            return response
+        # Op versie en ETag, dan kan een nieuwe versie de oude antwoorden opruimen
+        opgeslagen = cache.get((v, tag))
+        if opgeslagen is not None:
+            return _antwoord(opgeslagen, tag)
+        g.antwoord_sleutel = (v, tag)
+        return None
+
+    @server.after_request
+    def bewaar(response):
+        sleutel = g.pop("antwoord_sleutel", None)
+        # Alleen een compleet antwoord van de callback zelf, geen fout of 204
+        # (PreventUpdate)
+        if (
+            sleutel is None
+            or response.status_code != 200
+            or response.direct_passthrough
+        ):
+            return response
+        ruw = response.get_data()
+        opgeslagen = (ruw, brotli.compress(ruw))
+        cache.put(sleutel, opgeslagen)
+        return _antwoord(opgeslagen, sleutel[1], response)
+
+    return cache
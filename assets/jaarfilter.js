@@ -0,0 +1,59 @@
+// Filteren op tijdvak in de browser.
+//
+// De server stuurt per figuur eenmaal het figuur over de hele periode (in een
+// dcc.Store), de Jaarslider snijdt daar hier uit, zonder request naar de server.
+// Zelfde resultaat als filterdatum in dashboard_docentenbeleid.py: alleen de
+// kwartalen ("2021 Q3") binnen de gekozen jaren blijven over.
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    docenten: {
+        jaarfilter: function (figuur, jaren) {
+            if (!figuur) {
+                return window.dash_clientside.no_update;
+            }
+
+            const isKwartaal = (waarde) => /^\d{4} Q[1-4]$/.test(waarde);
+            const binnen = (kwartaal) => {
+                const jaar = parseInt(kwartaal.slice(0, 4), 10);
+                return jaar >= jaren[0] && jaar <= jaren[1];
+            };
+            // Kolommen die per punt een waarde hebben
+            const perPunt = ["x", "y", "text", "hovertext", "customdata", "ids"];
+
+            const data = [];
+            figuur.data.forEach(function (trace) {
+                // Een trace per kwartaal, zoals de boxplot (kleur is Datum)
+                if (isKwartaal(trace.name)) {
+                    if (binnen(trace.name)) {
+                        data.push(trace);
+                    }
+                    return;
+                }
+                // Kwartalen op de x-as: alleen de punten binnen het tijdvak
+                if (!Array.isArray(trace.x) || !trace.x.every(isKwartaal)) {
+                    data.push(trace);
+                    return;
+                }
+                const houden = trace.x.map(binnen);
+                const gefilterd = Object.assign({}, trace);
+                perPunt.forEach(function (kolom) {
+                    if (Array.isArray(trace[kolom]) && trace[kolom].length === houden.length) {
+                        gefilterd[kolom] = trace[kolom].filter((_, i) => houden[i]);
+                    }
+                });
+                data.push(gefilterd);
+            });
+
+            const layout = Object.assign({}, figuur.layout);
+            Object.keys(layout).forEach(function (as) {
+                if (as.startsWith("xaxis") && layout[as] && Array.isArray(layout[as].categoryarray)) {
+                    layout[as] = Object.assign({}, layout[as], {
+                        categoryarray: layout[as].categoryarray.filter(binnen),
+                    });
+                }
+            });
+
+            return Object.assign({}, figuur, {data: data, layout: layout});
+        },
+    },
+});
@@ -0,0 +1,91 @@
+"""Vergelijk preprocess met de oude versie (groupby + melt + groupby).
+
+Als invoer wordt een export in het formaat van UvA Data teruggerekend uit de
+opgeslagen dataset, eventueel een aantal keer vermenigvuldigd met nieuwe persnrs.
+Beide versies moeten rij voor rij precies hetzelfde geven.
+
+Gebruik: python benchmarks/bench_preprocess.py [--schaal 10] [--herhaal 3]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import docenten as d
+import opslag
+from referentie import preprocess_melt
+
+
+def naar_export(df, schaal=1):
+    """Reken de maanddata terug naar het brede formaat van de export:
+    1 regel per (Organisatie, Kalenderjaar, Onderwijskwalificatie, Dienstverband,
+    Functie, persnr) met de FTEs in de kolommen "01" t/m "12".
+    """
+    df = df.assign(
+        Dienstverband=df["Dienstverband"]
+        .astype(str)
+        .replace({"Tijdelijk": "Bezoldigd", "Vast": "Uitbreiding"}),
+        maand=[f"{m:02d}" for m in df["maand"]],
+    )
+    breed = df.pivot_table(
+        index=[
+            "Organisatie",
+            "Kalenderjaar",
+            "Onderwijskwalificatie",
+            "Dienstverband",
+            "Functie",
+            "persnr",
+        ],
+        columns="maand",
+        values="fte",
+        aggfunc="sum",
+        observed=True,
+    ).reset_index()
+    breed.columns.name = None
+    for kolom in d.CATEGORISCH:
+        if kolom in breed.columns:
+            breed[kolom] = breed[kolom].astype(str)
+
+    # Meer mensen: kopieen met andere persnrs
+    kopieen = [breed.assign(persnr=breed["persnr"] + i) for i in range(schaal)]
+    breed = pd.concat(kopieen, ignore_index=True)
+    return breed.rename(columns={"persnr": "UvA personeelsnummer"})
+
+
+def tijd(functie, herhaal):
+    tijden = []
+    for _ in range(herhaal):
+        start = time.perf_counter()
+        resultaat = functie()
+        tijden.append(time.perf_counter() - start)
+    return min(tijden), resultaat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--data", default=os.path.join(REPO, "data/Docenten_2020-2022_hashed")
+    )
+    parser.add_argument("--schaal", type=int, default=1)
+    parser.add_argument("--herhaal", type=int, default=3)
+    args = parser.parse_args()
+
+    df, _ = opslag.lees(args.data)
+    export = naar_export(df, schaal=args.schaal)
+    print(f"Export: {len(export)} regels")
+
+    t_oud, oud = tijd(lambda: preprocess_melt(export.copy()), args.herhaal)
+    t_nieuw, nieuw = tijd(lambda: d.preprocess(export.copy()), args.herhaal)
+
+    pd.testing.assert_frame_equal(
+        oud.reset_index(drop=True), nieuw.reset_index(drop=True), check_exact=True
+    )
+    print(f"Identiek: {len(nieuw)} rijen")
+    print(f"melt + groupby: {t_oud:8.3f} s")
+    print(f"reshape:        {t_nieuw:8.3f} s  ({t_oud / t_nieuw:.1f}x sneller)")
@@ -0,0 +1,307 @@
+"""Loadtest van het dashboard met veel gelijktijdige gebruikers, volledig lokaal.
+
+Start gunicorn (met gunicorn.conf.py) op een lokale poort, of gebruik een draaiende
+server met --url. Elke gebruiker doet wat een browser doet: de pagina en de layout
+ophalen, alle server callbacks met de beginwaarden, en daarna steeds (na een
+denktijd) een andere Functie of de head count/FTE switch kiezen, waarna alleen
+de callbacks die van die invoer afhangen opnieuw gevraagd worden. De payloads
+voor _dash-update-component komen uit /_dash-dependencies, dus ze kloppen met
+de callbacks van de app. Het tijdvak filtert de browser, dat kost de server niets.
+
+Na afloop: p50/p95/p99 latency (totaal en per callback), throughput, en per
+gunicorn worker de gebruikte CPU en het geheugen (RSS en piek), uit /proc.
+
+Gebruik: python benchmarks/loadtest.py [--gebruikers 50] [--duur 30]
+                                       [--denktijd 1.0] [--workers 4]
+"""
+
+import argparse
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def vrije_poort():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(workers, poort):
+    proces = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            "gunicorn.conf.py",
+            "--workers",
+            str(workers),
+            "--bind",
+            f"127.0.0.1:{poort}",
+            "dashboard_docentenbeleid:server",
+        ],
+        cwd=REPO,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{poort}"
+    for _ in range(600):
+        try:
+            urllib.request.urlopen(url + "/_dash-layout", timeout=1)
+            return proces, url
+        except OSError:
+            if proces.poll() is not None:
+                raise SystemExit("gunicorn is niet gestart")
+            time.sleep(0.1)
+    proces.kill()
+    raise SystemExit("gunicorn reageert niet")
+
+
+def haal(url, data=None):
+    """GET (of POST met JSON), geeft de body."""
+    verzoek = urllib.request.Request(url)
+    if data is not None:
+        verzoek.data = json.dumps(data).encode()
+        verzoek.add_header("Content-Type", "application/json")
+    with urllib.request.urlopen(verzoek, timeout=60) as antwoord:
+        return antwoord.read()
+
+
+def componenten(layout):
+    """Alle componenten met een id in de layout, als dict id -> props."""
+    gevonden = {}
+    stapel = [layout]
+    while stapel:
+        knoop = stapel.pop()
+        if isinstance(knoop, list):
+            stapel.extend(knoop)
+        elif isinstance(knoop, dict) and "props" in knoop:
+            props = knoop["props"]
+            if "id" in props:
+                gevonden[props["id"]] = props
+            stapel.append(props.get("children"))
+    return gevonden
+
+
+def payload(dependency, waarden, veranderd):
+    """De body van _dash-update-component voor een callback, zoals de browser die stuurt."""
+    uitvoer = dependency["output"]
+    if uitvoer.startswith(".."):
+        outputs = [
+            {"id": o.split(".")[0], "property": o.split(".")[1]}
+            for o in uitvoer.strip(".").split("...")
+        ]
+    else:
+        outputs = {"id": uitvoer.split(".")[0], "property": uitvoer.split(".")[1]}
+    return {
+        "output": uitvoer,
+        "outputs": outputs,
+        "inputs": [
+            dict(i, value=waarden.get((i["id"], i["property"])))
+            for i in dependency["inputs"]
+        ],
+        "changedPropIds": veranderd,
+        "state": [
+            dict(s, value=waarden.get((s["id"], s["property"])))
+            for s in dependency["state"]
+        ],
+    }
+
+
+class Metingen:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.fouten = 0
+
+    def meet(self, naam, functie):
+        start = time.perf_counter()
+        try:
+            functie()
+        except OSError:
+            with self.lock:
+                self.fouten += 1
+            return
+        duur = time.perf_counter() - start
+        with self.lock:
+            self.latency.setdefault(naam, []).append(duur)
+
+
+def gebruiker(url, dependencies, beginwaarden, keuzes, args, metingen, stop, rng):
+    waarden = dict(beginwaarden)
+
+    def callbacks(veranderd):
+        for dependency in dependencies:
+            invoer = {f"{i['id']}.{i['property']}" for i in dependency["inputs"]}
+            if veranderd is None or invoer & set(veranderd):
+                body = payload(dependency, waarden, veranderd or sorted(invoer))
+                metingen.meet(
+                    dependency["output"],
+                    lambda: haal(url + "/_dash-update-component", body),
+                )
+
+    metingen.meet("/", lambda: haal(url + "/"))
+    metingen.meet("_dash-layout", lambda: haal(url + "/_dash-layout"))
+    callbacks(None)
+    while not stop.is_set():
+        stop.wait(rng.expovariate(1 / args.denktijd) if args.denktijd else 0)
+        if stop.is_set():
+            break
+        sleutel = rng.choice(list(keuzes))
+        waarden[sleutel] = rng.choice(keuzes[sleutel])
+        callbacks([f"{sleutel[0]}.{sleutel[1]}"])
+
+
+def workers(master):
+    """pids van de gunicorn workers (de kinderen van de master)."""
+    pids = []
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                velden = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(velden[1]) == master:
+            pids.append(int(pid))
+    return sorted(pids)
+
+
+def proces_stand(pid):
+    """CPU-tijd (s), RSS en piek-RSS (MB) van een proces."""
+    with open(f"/proc/{pid}/stat") as f:
+        velden = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(velden[11]) + int(velden[12])) / os.sysconf("SC_CLK_TCK")
+    geheugen = {}
+    with open(f"/proc/{pid}/status") as f:
+        for regel in f:
+            if regel.startswith(("VmRSS", "VmHWM")):
+                naam, waarde = regel.split(":")
+                geheugen[naam] = int(waarde.split()[0]) / 1024
+    return cpu, geheugen.get("VmRSS", 0), geheugen.get("VmHWM", 0)
+
+
+def rapport(metingen, duur, cpu_voor, cpu_na):
+    if metingen.latency:
+        latency_tabel(metingen, duur)
+    else:
+        # Bijv. een server die niet (meer) antwoordt: dan alleen de fouten
+        print(f"\ngeen requests afgerond in {duur:.1f} s, {metingen.fouten} fouten")
+
+    if cpu_na:
+        print("\nworker       CPU (s)   CPU (%)   RSS (MB)   piek (MB)")
+        for pid, (cpu, rss, piek) in cpu_na.items():
+            gebruikt = cpu - cpu_voor.get(pid, (0,))[0]
+            print(
+                f"{pid:<10}  {gebruikt:8.2f}  {gebruikt / duur * 100:8.1f}  "
+                f"{rss:9.0f}  {piek:10.0f}"
+            )
+
+
+def latency_tabel(metingen, duur):
+    alle = np.concatenate([np.array(l) for l in metingen.latency.values()])
+    print(
+        f"\n{len(alle)} requests in {duur:.1f} s: {len(alle) / duur:.1f} req/s, "
+        f"{metingen.fouten} fouten"
+    )
+    regels = [("totaal", alle)] + sorted(
+        (naam, np.array(l)) for naam, l in metingen.latency.items()
+    )
+    breedte = max(len(naam) for naam, _ in regels)
+    print(f"{'':<{breedte}}  {'n':>6}  {'p50':>8}  {'p95':>8}  {'p99':>8}  (ms)")
+    for naam, latency in regels:
+        p50, p95, p99 = np.percentile(latency, [50, 95, 99]) * 1000
+        print(
+            f"{naam:<{breedte}}  {len(latency):>6}  {p50:8.1f}  {p95:8.1f}  {p99:8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--gebruikers", type=int, default=50)
+    parser.add_argument("--duur", type=float, default=30, help="seconden")
+    parser.add_argument(
+        "--denktijd", type=float, default=1.0, help="gemiddelde denktijd (s)"
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--url", help="gebruik een draaiende server in plaats van gunicorn"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    proces = None
+    if args.url:
+        url = args.url.rstrip("/")
+    else:
+        proces, url = start_gunicorn(args.workers, vrije_poort())
+
+    try:
+        layout = componenten(json.loads(haal(url + "/_dash-layout")))
+        dependencies = [
+            dep
+            for dep in json.loads(haal(url + "/_dash-dependencies"))
+            if not dep.get("clientside_function")
+        ]
+        beginwaarden = {
+            (i["id"], i["property"]): layout.get(i["id"], {}).get(i["property"])
+            for dep in dependencies
+            for i in dep["inputs"] + dep["state"]
+        }
+        # Wat een gebruiker kan kiezen: de opties van de dropdown en de switch
+        keuzes = {}
+        for sleutel in beginwaarden:
+            props = layout.get(sleutel[0], {})
+            if "options" in props:
+                keuzes[sleutel] = [o["value"] for o in props["options"]]
+            elif isinstance(beginwaarden[sleutel], bool) or sleutel[1] == "on":
+                keuzes[sleutel] = [False, True]
+
+        pids = workers(proces.pid) if proces else []
+        cpu_voor = {pid: proces_stand(pid) for pid in pids}
+
+        metingen, stop = Metingen(), threading.Event()
+        draden = [
+            threading.Thread(
+                target=gebruiker,
+                args=(
+                    url,
+                    dependencies,
+                    beginwaarden,
+                    keuzes,
+                    args,
+                    metingen,
+                    stop,
+                    random.Random(args.seed + i),
+                ),
+            )
+            for i in range(args.gebruikers)
+        ]
+        start = time.perf_counter()
+        for draad in draden:
+            draad.start()
+        time.sleep(args.duur)
+        stop.set()
+        for draad in draden:
+            draad.join()
+        duur = time.perf_counter() - start
+
+        cpu_na = {pid: proces_stand(pid) for pid in pids}
+        rapport(metingen, duur, cpu_voor, cpu_na)
+    finally:
+        if proces:
+            proces.send_signal(signal.SIGTERM)
+            proces.wait()
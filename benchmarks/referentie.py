@@ -0,0 +1,345 @@
+"""Referentie-implementaties om geoptimaliseerde code tegen te controleren.
+
+Dit zijn de oorspronkelijke versies van functies uit docenten.py, zodat de
+benchmarks kunnen controleren dat de snellere versies precies hetzelfde geven:
+preprocess, en de analyses uit de eerste versie van docenten.py, rechtstreeks
+op de maanddata (zonder plot en zonder filters). Ze gebruiken niets uit
+docenten.py behalve compact en datum_ordinaal, zodat de overgangen, de kubus en
+kwartaal_summary echt tegen de oorspronkelijke code gecontroleerd worden.
+"""
+
+import numpy as np
+import pandas as pd
+
+import docenten as d
+
+
+def preprocess_melt(df, faculteiten=["FGw", "FMG", "FdR", "FNWI", "FEB"]):
+    """preprocess zoals die was: groupby met nansum, melt en een tweede groupby."""
+    # General preprocessing that always happens.
+    df = df.rename(columns={"UvA personeelsnummer": "persnr"})
+
+    ### Voor Rechten: PPLE eruit ###############
+    # De data heeft 3 niveaus voor de orgnaisatie:
+    # faculteit, WP faculteit en dan de afdelingen.
+    # Mensen komen voor in alle lagen. Veredrop filteren
+    # we alleen op faculteitsniveau zodat iedereen 1x voorkomt.
+    # Voor rechten gebruiken we de lagere lagen om PPLE eruit te kunnen gooien:
+    # - Verwijder hoge niveau rechten en de lage-niveau regels met PPLE
+    # - Hernoem alle andere lage niveaus naar topniveau,
+    #   zodat later bij de selectie al deze mensen blijven.
+
+    if "PPLE" in faculteiten:
+        # Voor PPLE apart in de output
+        df.replace("Afd. PPLE", "PPLE", inplace=True)
+
+    if "FdR" in faculteiten:
+        # Rechten is een geval apart: PPLE moet eruit
+        rechten = [
+            "Afd. Privaatrecht",
+            "Afd.Int./Eur.Recht",
+            "wp afd. Alg. Recht",
+            "wp afd. Publiekrecht",
+        ]
+
+        # Deze regels eruit, zodat de lager-niveau regels zonder PPLE hernoemd kan worden
+        df = df[df.Organisatie != "FdR"]
+        df.replace(rechten, "FdR", inplace=True)
+
+    df = df[df["Organisatie"].isin(faculteiten)]
+
+    # Hernoem Bezoldigd en UItbreiding naar Tijdelijk en Vast.
+    df = df.replace(["Bezoldigd", "Uitbreiding"], ["Tijdelijk", "Vast"])
+    # Tel FTEs per "omvang dienstverband" bij elkaar op,
+    # nansum, want anders wordt x+NaN = NaN, nu x+NaN = x
+    df = df.groupby(
+        [
+            "Organisatie",
+            "Kalenderjaar",
+            "Onderwijskwalificatie",
+            "Dienstverband",
+            "Functie",
+            "persnr",
+        ],
+        as_index=False,
+        observed=True,
+    ).agg(np.nansum)
+
+    # Naar long format waarin alle maanden voorkomen,
+    # maak daar integers van en construeer kwartalen
+    df_long = pd.melt(
+        df,
+        id_vars=[
+            "Organisatie",
+            "Kalenderjaar",
+            "Onderwijskwalificatie",
+            "Dienstverband",
+            "Functie",
+            "persnr",
+        ],
+        value_vars=[
+            "01",
+            "02",
+            "03",
+            "04",
+            "05",
+            "06",
+            "07",
+            "08",
+            "09",
+            "10",
+            "11",
+            "12",
+        ],
+        var_name="maand",
+        value_name="fte",
+    )
+    df_long["maand"] = df_long["maand"].astype(int)
+
+    # Onderwijskwalificatie aggregeren naar hoogste niveau,
+    # FTEs optellen over de kwalificaties
+    df_long.replace("Geen", "AAGeen", inplace=True)  # (voor aggregatie, zie onder)
+    df_long = df_long.groupby(
+        ["Organisatie", "Functie", "persnr", "Kalenderjaar", "maand", "Dienstverband"],
+        as_index=False,
+        observed=True,
+    ).agg({"Onderwijskwalificatie": "max", "fte": "sum"})
+    df_long.replace("AAGeen", "Geen", inplace=True)
+
+    df_long["kwartaal"] = "Q" + ((df_long.maand + 2) // 3).astype(str)
+    df_long = df_long.dropna()  # Many NaN FTE, meaning 0.
+    # Onbekende dienstverbanden, en maanden zonder dienstbetrekking eruit
+    # Alleen precies 0 eruit, soms negatief = correctie op ander dienstverband?
+    df_long = df_long[((df_long.fte != 0) & (df_long.Dienstverband != "Onbekend"))]
+
+    # Datum als kwartaalnummer, labels als "2021 Q3" alleen voor weergave
+    df_long["Datum"] = d.datum_ordinaal(df_long["Kalenderjaar"], df_long["maand"])
+
+    df = df_long.sort_values(
+        ["Organisatie", "persnr", "Functie", "Kalenderjaar", "maand"]
+    )
+
+    return d.compact(df)
+
+
+# De analyses hieronder zijn die van de eerste versie van docenten.py, met alleen
+# wat het compacte frame van compact() nodig heeft: observed=True bij de
+# groupby's (categorische kolommen) en tekst als kolomnamen na de pivot.
+
+
+def _pivot_vast(df_kwart, waarde):
+    """De pivot naar Tijdelijk, Vast en Totaal zoals in perc_vast_FTE/HC stond."""
+    ## Per organisatie, per kwartaal, per Dienstverband ...
+    # tellen we nu FTEs op per dienstverband.
+    df_pivot = df_kwart.pivot(
+        index=["Organisatie", "Datum"], columns="Dienstverband", values=waarde
+    )
+    df_pivot.columns = df_pivot.columns.astype(str)
+    # Als het kwartaal niet voorkomt zijn er kennelijk 0 mensen:
+    df_pivot["Tijdelijk"] = df_pivot["Tijdelijk"].replace(np.nan, 0)
+    df_pivot["Vast"] = df_pivot["Vast"].replace(np.nan, 0)
+    # Totaal is som vast en tijdelijk (let op caveats boven)
+    df_pivot["Totaal"] = df_pivot["Tijdelijk"] + df_pivot["Vast"]
+
+    # Fracties tijdelijk en vast
+    df_pivot["fractie vast contract"] = df_pivot["Vast"] / (df_pivot["Totaal"])
+    df_pivot["fractie tijdelijk contract"] = df_pivot["Tijdelijk"] / (
+        df_pivot["Totaal"]
+    )
+    df_sorted = df_pivot.sort_values(["Organisatie", "Datum"]).reset_index()
+
+    # Maak percentages
+    df_sorted["Percentage met Vast contract"] = df_sorted["fractie vast contract"] * 100
+    df_sorted["Percentage met Tijdelijk contract"] = (
+        df_sorted["fractie tijdelijk contract"] * 100
+    )
+
+    return df_sorted
+
+
+def perc_vast_FTE(df, functie="Docent 4"):
+    """perc_vast_FTE zoals die was: twee groupby's over de maanddata van functie."""
+    df = df[df.Functie == functie]
+    # FTEs optellen voor verschillende mensen, maar middelen over de drie maanden.
+    df_kwart_mean_person = df.groupby(
+        ["Organisatie", "Datum", "Dienstverband", "persnr"],
+        as_index=False,
+        observed=True,
+    )["fte"].mean()
+    df_kwart_sum = (
+        df_kwart_mean_person.groupby(
+            ["Organisatie", "Datum", "Dienstverband"], as_index=False, observed=True
+        )["fte"]
+        .sum()
+        .reset_index()
+    )
+
+    return _pivot_vast(df_kwart_sum, "fte")
+
+
+def perc_vast_HC(df, functie="Docent 4"):
+    """perc_vast_HC zoals die was: nunique van persnr over de maanddata van functie."""
+    df = df[df.Functie == functie]
+    df_kwart_count = df.groupby(
+        ["Organisatie", "Datum", "Dienstverband"], as_index=False, observed=True
+    )["persnr"].nunique()
+
+    return _pivot_vast(df_kwart_count, "persnr")
+
+
+def tijdelijk_vast(df, functie="Docent 4"):
+    """tijdelijk_vast zoals die was: per persoon het laatste kwartaal tijdelijk en
+    het eerste vast, en die twee gemerged."""
+    df = df[df.Functie == functie]
+
+    # Laatste tijdelijk en eerste vast
+    df_tijdelijk = (
+        df[df.Dienstverband == "Tijdelijk"]
+        .groupby(["Organisatie", "persnr"], as_index=False, observed=True)
+        .Datum.max()
+    )
+    df_vast = (
+        df[df.Dienstverband == "Vast"]
+        .groupby(["Organisatie", "persnr"], as_index=False, observed=True)
+        .Datum.min()
+    )
+
+    df_vast.rename(columns={"Datum": "Eerste kwartaal vast"}, inplace=True)
+
+    df_tv = pd.merge(df_tijdelijk, df_vast, how="inner")
+
+    df_tv = df_tv.groupby(
+        ["Organisatie", "Datum"], as_index=False, observed=True
+    ).persnr.nunique()
+    df_tv.rename(columns={"persnr": "# naar vast"}, inplace=True)
+
+    # Voeg ook totaal aantal docenten toe ter vergelijking
+    tot = (
+        df[df.Dienstverband == "Tijdelijk"]
+        .groupby(["Organisatie", "Datum"], as_index=False, observed=True)
+        .persnr.nunique()
+    )
+    tot.rename(columns={"persnr": f"{functie}, Tijdelijk"}, inplace=True)
+    df_tv = tot.merge(df_tv, how="left")
+    df_tv.replace(np.nan, 0, inplace=True)
+
+    return df_tv
+
+
+def promotie(df, van="Docent 4", naar="Docent 3"):
+    """promotie zoals die was: per persoon het laatste kwartaal in 'van' en het
+    eerste in 'naar', en die twee gemerged."""
+    df_van = df[df.Functie == van]
+    df_naar = df[df.Functie == naar]
+
+    # Laatste kwartaal in 'van' en eerste in 'naar'
+    df_goodbye = df_van.groupby(
+        ["Organisatie", "persnr"], as_index=False, observed=True
+    ).Datum.max()
+    df_hello = df_naar.groupby(
+        ["Organisatie", "persnr"], as_index=False, observed=True
+    ).Datum.min()
+
+    df_goodbye.rename(columns={"Datum": f"Laatste kwartaal {van}"}, inplace=True)
+    df_hello.rename(columns={"Datum": f"Eerste kwartaal {naar}"}, inplace=True)
+
+    df_promotie = pd.merge(
+        df_goodbye, df_hello, how="inner", on=["Organisatie", "persnr"]
+    )
+
+    # Aantallen van/naar per kwartaal en aantallen promoties per kwartaal
+    df_tot = df_van.groupby(
+        ["Organisatie", "Datum"], as_index=False, observed=True
+    ).persnr.nunique()
+    df_proms = df_promotie.groupby(
+        ["Organisatie", f"Laatste kwartaal {van}"], as_index=False, observed=True
+    ).persnr.nunique()
+
+    df_tot.rename(columns={"persnr": f"{van}"}, inplace=True)
+    df_proms.rename(
+        columns={"persnr": "Omzettingen", f"Laatste kwartaal {van}": "Datum"},
+        inplace=True,
+    )
+    df_promoties = pd.merge(df_tot, df_proms, how="left", on=["Organisatie", "Datum"])
+    df_promoties.replace(np.nan, 0, inplace=True)
+    df_promoties["Aantal geen promotie"] = (
+        df_promoties[f"{van}"] - df_promoties["Omzettingen"]
+    )
+    df_promoties["Percentage Omzettingen"] = (
+        df_promoties["Omzettingen"] / df_promoties[f"{van}"] * 100
+    )
+
+    return df_promoties
+
+
+def fte_pp(df, functie="Docent 4"):
+    """fte_pp zoals die was: perc_vast_HC en perc_vast_FTE opnieuw berekend."""
+    headcount = perc_vast_HC(df, functie=functie)
+    fte = perc_vast_FTE(df, functie=functie)
+
+    headcount.rename(
+        columns={"Vast": "vast_hc", "Tijdelijk": "tijdelijk_hc", "Totaal": "totaal_hc"},
+        inplace=True,
+    )
+    headcount = headcount[
+        ["Organisatie", "Datum", "vast_hc", "tijdelijk_hc", "totaal_hc"]
+    ]
+    fte = fte.merge(headcount, on=["Organisatie", "Datum"])
+
+    fte["FTE_pp_vast"] = fte.Vast / fte.vast_hc
+    fte["FTE_pp_tijdelijk"] = fte.Tijdelijk / fte.tijdelijk_hc
+
+    return fte
+
+
+def fte_dist(df, functie="Docent 4"):
+    """fte_dist zoals die was: een groupby over de maanddata van functie."""
+    return (
+        df[df.Functie == functie]
+        .groupby(
+            ["Organisatie", "persnr", "Datum", "Dienstverband"],
+            as_index=False,
+            observed=True,
+        )
+        .fte.mean()
+    )
+
+
+def percentages_docenten(df, functies=["Docent 1", "Docent 2", "Docent 3", "Docent 4"]):
+    """percentages_docenten zoals die was: perc_vast_HC per functie, met de
+    totalen per (Organisatie, Datum) erbij."""
+    # Gebruik voorgaande functionaliteit, ook al duurt dat wat langer
+    all_functies = pd.concat(
+        [
+            perc_vast_HC(df, functie=functie).assign(Functie=functie)
+            for functie in functies
+        ]
+    )
+
+    aantallen = all_functies.groupby(
+        ["Organisatie", "Datum"], as_index=False, observed=True
+    )[["Tijdelijk", "Vast", "Totaal"]].sum()
+    aantallen.rename(
+        columns={
+            "Tijdelijk": "Totaal tijdelijk",
+            "Vast": "Totaal vast",
+            "Totaal": "Totaal allen",
+        },
+        inplace=True,
+    )
+
+    all_functies = all_functies[
+        ["Organisatie", "Datum", "Functie", "Tijdelijk", "Vast", "Totaal"]
+    ].merge(aantallen, how="left", on=["Organisatie", "Datum"])
+
+    all_functies["Percentage tijdelijk"] = (
+        all_functies["Tijdelijk"] / all_functies["Totaal tijdelijk"] * 100
+    )
+    all_functies["Percentage vast"] = (
+        all_functies["Vast"] / all_functies["Totaal vast"] * 100
+    )
+    all_functies["Percentage allen"] = (
+        all_functies["Totaal"] / all_functies["Totaal allen"] * 100
+    )
+
+    return all_functies
@@ -0,0 +1,335 @@
+"""Benchmarks voor preprocess, de analyses in docenten.py en de figuren van het
+dashboard, op synthetische exports (synthetisch.py) van oplopende omvang.
+
+Elke stap wordt getimed en gecontroleerd:
+- preprocess tegen referentie.preprocess_melt (tot --referentie-tot) en tegen
+  preprocess_stroom en preprocess_parallel, rij voor rij precies gelijk; ook
+  preprocess_stroom op een CSV in stukken met een lege persnr, en
+  preprocess_parallel op een export zonder regels (van de faculteiten)
+- maanden toevoegen aan een eerdere levering (prepare_public.py --toevoegen) tegen
+  de hele export in 1 keer, rij voor rij en met dezelfde versie
+- de analyses op de kubus tegen de oorspronkelijke functies op de maanddata, in
+  referentie.py
+- de analyses op een faculteit of een jaar tegen die op alles, op de echte data
+- alles tegen golden outputs, als die er zijn. Maak ze met --schrijf-golden op
+  een versie die je vertrouwt; elke volgende run vergelijkt ermee, zodat een
+  snellere versie aantoonbaar hetzelfde geeft.
+
+Gebruik: python benchmarks/suite.py [--schaal 1 10 100] [--herhaal 3]
+                                    [--golden benchmarks/golden] [--schrijf-golden]
+"""
+
+import argparse
+import importlib
+import json
+import math
+import os
+import pickle
+import sys
+import tempfile
+from functools import partial
+
+import pandas as pd
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import docenten as d
+import opslag
+import referentie
+from bench_preprocess import tijd
+from synthetisch import genereer
+
+
+def analyses(df, kubus, prom_map):
+    """Per analyse: de oorspronkelijke functie op de maanddata (referentie.py) en de
+    versie op de kubus."""
+    paren = {}
+    for functie, naar in prom_map.items():
+        paren[f"perc_vast_HC/{functie}"] = (
+            partial(referentie.perc_vast_HC, df, functie=functie),
+            partial(d.perc_vast_kubus, kubus, functie=functie, maat="headcount"),
+        )
+        paren[f"perc_vast_FTE/{functie}"] = (
+            partial(referentie.perc_vast_FTE, df, functie=functie),
+            partial(d.perc_vast_kubus, kubus, functie=functie, maat="fte"),
+        )
+        paren[f"tijdelijk_vast/{functie}"] = (
+            partial(referentie.tijdelijk_vast, df, functie=functie),
+            partial(d.tijdelijk_vast_kubus, kubus, functie=functie),
+        )
+        paren[f"promotie/{functie}"] = (
+            partial(referentie.promotie, df, van=functie, naar=naar),
+            partial(d.promotie_kubus, kubus, van=functie, naar=naar),
+        )
+        paren[f"fte_dist/{functie}"] = (
+            partial(referentie.fte_dist, df, functie=functie),
+            partial(d.fte_dist_kubus, kubus, functie=functie),
+        )
+    paren["percentages_docenten"] = (
+        partial(referentie.percentages_docenten, df),
+        partial(d.percentages_docenten_kubus, kubus),
+    )
+    return paren
+
+
+def zelfde(a, b, exact=False):
+    """Zelfde tabel of figuur, op afronding na (tenzij exact)."""
+    if isinstance(a, pd.DataFrame):
+        pd.testing.assert_frame_equal(
+            a.reset_index(drop=True),
+            b.reset_index(drop=True),
+            check_exact=exact,
+            check_dtype=exact,
+            check_categorical=exact,
+            rtol=1e-5,
+        )
+    elif isinstance(a, dict):
+        assert a.keys() == b.keys(), f"{sorted(a)} != {sorted(b)}"
+        for sleutel in a:
+            zelfde(a[sleutel], b[sleutel], exact)
+    elif isinstance(a, list):
+        assert len(a) == len(b), f"{len(a)} != {len(b)}"
+        for x, y in zip(a, b):
+            zelfde(x, y, exact)
+    elif isinstance(a, float) and isinstance(b, (int, float)):
+        assert math.isclose(a, b, rel_tol=1e-5) or a == b or a != a and b != b, (a, b)
+    else:
+        assert a == b, (a, b)
+
+
+def controleer_lege_persnr(export, chunk_rijen=3000):
+    """preprocess_stroom op een CSV met een lege persnr: het stuk met de lege cel
+    leest pandas als float64, de andere als int64. Moet gelijk zijn aan preprocess."""
+    export = export.copy()
+    export.loc[len(export) // 2, "UvA personeelsnummer"] = None
+    export["UvA personeelsnummer"] = export["UvA personeelsnummer"].astype("Int64")
+    with tempfile.TemporaryDirectory() as tmp:
+        pad = os.path.join(tmp, "export.csv")
+        export.to_csv(pad, index=False)
+        zelfde(
+            d.preprocess_stroom(
+                opslag.lees_export_chunks(pad, chunk_rijen=chunk_rijen)
+            ),
+            d.preprocess(pd.read_csv(pad)),
+            exact=True,
+        )
+
+
+def controleer_leeg(export):
+    """Een export zonder regels, of zonder regels van de faculteiten: dezelfde lege
+    maanddata uit preprocess_parallel als uit preprocess."""
+    for df, faculteiten in [(export.iloc[:0], None), (export, ["Bestaat niet"])]:
+        kwargs = {} if faculteiten is None else {"faculteiten": faculteiten}
+        zelfde(
+            d.preprocess(df.copy(), **kwargs),
+            d.preprocess_parallel(df.copy(), **kwargs),
+            exact=True,
+        )
+
+
+def controleer_toevoegen(export, jaar, maand, sleutel="suite"):
+    """Zoals prepare_public.py --toevoegen: een eerdere levering t/m (jaar, maand),
+    daarna de maanden erna toevoegen. Moet rij voor rij (en dus met dezelfde versie)
+    gelijk zijn aan de hele export in 1 keer, en de bijgewerkte kubus aan een nieuwe.
+    """
+    eerder = export.copy()
+    eerder.loc[eerder["Kalenderjaar"] > jaar, d.MAANDEN] = None
+    eerder.loc[eerder["Kalenderjaar"] == jaar, d.MAANDEN[maand:]] = None
+
+    def maak(df_raw):
+        return d.sorteer(d.hash_nr(d.preprocess(df_raw), "persnr", sleutel))
+
+    bestaand = maak(eerder)
+    nieuw = d.hash_nr(d.preprocess(d.na_maand(export, jaar, maand)), "persnr", sleutel)
+    toegevoegd, datums = d.voeg_maanden_toe(bestaand, nieuw, jaar, maand)
+    alles = maak(export.copy())
+    zelfde(alles, toegevoegd, exact=True)
+    zelfde(
+        d.bouw_kubus(alles),
+        d.werk_kubus_bij(d.bouw_kubus(bestaand), toegevoegd, datums),
+        exact=True,
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        versies = [
+            opslag.schrijf_kolommen(df, os.path.join(tmp, naam))["versie"]
+            for naam, df in [("alles", alles), ("toegevoegd", toegevoegd)]
+        ]
+    assert versies[0] == versies[1], versies
+
+
+def controleer_selecties(df):
+    """De analyses op een smalle selectie (een faculteit, een jaar, een functie)
+    moeten dezelfde rijen geven als op alles, gefilterd. In zo'n selectie kan een
+    heel dienstverband ontbreken."""
+    organisaties = list(df["Organisatie"].cat.categories)
+    jaren = sorted(pd.unique(df["Kalenderjaar"]))
+    functies = list(df["Functie"].cat.categories)
+
+    def vergelijk(alles, selectie, organisatie, jaar):
+        if organisatie is not None:
+            alles = alles[alles["Organisatie"] == organisatie]
+        if jaar is not None:
+            alles = alles[
+                alles["Datum"].between(
+                    d.datum_ordinaal(jaar, 1), d.datum_ordinaal(jaar, 12)
+                )
+            ]
+        # Een lege selectie (een functie die een faculteit niet heeft) geeft de
+        # kolommen na merge in een andere volgorde
+        zelfde(alles, selectie[alles.columns])
+
+    analyses = [d.perc_vast_HC, d.perc_vast_FTE, d.fte_pp, d.fte_dist]
+    for organisatie in [None] + organisaties:
+        for jaar in [None] + jaren:
+            selectie = {
+                "organisaties": None if organisatie is None else [organisatie],
+                "jaren": None if jaar is None else (jaar, jaar),
+            }
+            for analyse in analyses:
+                for functie in functies:
+                    vergelijk(
+                        analyse(df, functie, plot=False),
+                        analyse(df, functie, plot=False, **selectie),
+                        organisatie,
+                        jaar,
+                    )
+            vergelijk(
+                d.percentages_docenten(df, plot=False),
+                d.percentages_docenten(df, plot=False, **selectie),
+                organisatie,
+                jaar,
+            )
+
+
+def draai(schaal, args):
+    tijden, resultaten = {}, {}
+
+    def stap(naam, functie, controle=None, exact=False):
+        tijden[naam], resultaat = tijd(functie, args.herhaal)
+        if controle is not None:
+            zelfde(controle, resultaat, exact)
+        resultaten[naam] = resultaat
+        return resultaat
+
+    export = genereer(schaal)
+    print(f"\nschaal {schaal}: {len(export)} regels export")
+
+    df = stap("preprocess", lambda: d.preprocess(export.copy()))
+    if schaal <= args.referentie_tot:
+        tijden["preprocess_melt"], oud = tijd(
+            lambda: referentie.preprocess_melt(export.copy()), args.herhaal
+        )
+        zelfde(oud, df, exact=True)
+    stukken = max(1, len(export) // 8)
+    tijden["preprocess_stroom"], stroom = tijd(
+        lambda: d.preprocess_stroom(
+            export[i : i + stukken] for i in range(0, len(export), stukken)
+        ),
+        args.herhaal,
+    )
+    zelfde(stroom, df, exact=True)
+    tijden["preprocess_parallel"], parallel = tijd(
+        lambda: d.preprocess_parallel(export.copy()), args.herhaal
+    )
+    zelfde(parallel, df, exact=True)
+    controleer_lege_persnr(export)
+    controleer_leeg(export)
+    controleer_toevoegen(export, 2021, 8)
+
+    kubus = stap("bouw_kubus", lambda: d.bouw_kubus(df))
+    for naam, tabel in kubus.items():
+        resultaten[f"kubus/{naam}"] = tabel
+    del resultaten["bouw_kubus"]
+
+    with tempfile.TemporaryDirectory() as pad:
+        opslag.publiceer(df, kubus, pad)
+        os.environ["DOCENTEN_DATA"] = pad
+        importlib.reload(importlib.import_module("instellingen"))
+        sys.modules.pop("dashboard_docentenbeleid", None)
+        tijden["dashboard importeren"], dashboard = tijd(
+            lambda: importlib.import_module("dashboard_docentenbeleid"), 1
+        )
+
+        # Analyses: de oorspronkelijke functies en de versies op de kubus
+        # In de golden de uitkomst van de oorspronkelijke code, de versie op de
+        # kubus moet daar gelijk aan zijn
+        for naam, (origineel, snel) in analyses(df, kubus, dashboard.prom_map).items():
+            tijden[f"analyse {naam}"], controle = tijd(origineel, args.herhaal)
+            stap(f"kubus {naam}", snel, controle)
+            del resultaten[f"kubus {naam}"]
+            resultaten[f"analyse {naam}"] = controle
+
+        # Figuren, zonder caches en zonder vooraf gemaakte figuren
+        for naam, (maak, afhankelijk) in dashboard.FIGUREN.items():
+            for functie in dashboard.prom_map:
+                for ftehc in [False, True] if "ftehc" in afhankelijk else [False]:
+                    invoer = {
+                        "Functie": functie,
+                        "jaren": dashboard.laad().volledig,
+                        "ftehc": ftehc,
+                    }
+                    argumenten = [invoer[a] for a in afhankelijk]
+                    sleutel = opslag.figuur_sleutel(naam, *argumenten)
+                    dashboard.tabellen_cache.clear()
+                    stap(
+                        f"figuur {sleutel}",
+                        lambda: json.loads(maak(*argumenten).to_json()),
+                    )
+                    if "Functie" not in afhankelijk:
+                        break
+
+    golden = os.path.join(args.golden, f"schaal_{schaal}.pkl")
+    if args.schrijf_golden:
+        os.makedirs(args.golden, exist_ok=True)
+        with open(golden, "wb") as f:
+            pickle.dump(resultaten, f)
+        print(f"golden geschreven: {golden}")
+    elif os.path.exists(golden):
+        with open(golden, "rb") as f:
+            zelfde(pickle.load(f), resultaten, exact=False)
+        print(f"gelijk aan golden: {golden}")
+    else:
+        print(f"geen golden in {golden}, alleen onderling gecontroleerd")
+
+    return tijden
+
+
+def rapport(tijden):
+    """Tijden per stap; de analyses en figuren per soort opgeteld."""
+    soorten = {}
+    for naam, seconden in tijden.items():
+        soort = naam.split("/")[0]
+        soorten[soort] = soorten.get(soort, 0) + seconden
+    breedte = max(len(soort) for soort in soorten)
+    for soort, seconden in soorten.items():
+        print(f"  {soort:<{breedte}}  {seconden * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--schaal", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--herhaal", type=int, default=3)
+    parser.add_argument(
+        "--referentie-tot",
+        type=int,
+        default=10,
+        help="vergelijk met preprocess_melt tot en met deze schaal (die is traag)",
+    )
+    parser.add_argument(
+        "--golden", default=os.path.join(os.path.dirname(__file__), "golden")
+    )
+    parser.add_argument("--schrijf-golden", action="store_true")
+    parser.add_argument(
+        "--data",
+        default=os.path.join(REPO, "data", "Docenten_2020-2022_hashed"),
+        help="echte dataset om de analyses op smalle selecties te controleren",
+    )
+    args = parser.parse_args()
+
+    if os.path.exists(args.data):
+        controleer_selecties(opslag.lees(args.data)[0])
+        print(f"selecties gecontroleerd op {args.data}")
+
+    for schaal in args.schaal:
+        rapport(draai(schaal, args))
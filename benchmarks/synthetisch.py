@@ -0,0 +1,167 @@
+"""Synthetische exports in het formaat van UvA Data, voor de benchmarks.
+
+genereer(schaal) geeft een export zoals preprocess die inleest: per regel
+Organisatie, Kalenderjaar, Onderwijskwalificatie, Dienstverband, Functie en
+UvA personeelsnummer, met de FTEs in de maandkolommen "01" t/m "12".
+Zoals in de echte export komt iedereen voor op drie niveaus van de organisatie
+(faculteit, WP faculteit en afdeling), met bij Rechten de afdelingen uit
+docenten.RECHTEN en "Afd. PPLE". Er zijn loopbanen met promoties en omzettingen
+van tijdelijk naar vast, mensen met meerdere aanstellingen, en regels die
+preprocess eruit moet filteren (AUC, dienstverband Onbekend).
+
+schaal=1 geeft ongeveer de omvang van de echte data (~1700 docenten in de
+faculteiten, ~30k regels na preprocess), schaal=100 honderd keer zoveel.
+"""
+
+import numpy as np
+import pandas as pd
+
+import docenten as d
+
+# Faculteit en aandeel van de docenten, ongeveer zoals in de echte data
+FACULTEITEN = {
+    "FEB": 0.07,
+    "FGw": 0.29,
+    "FMG": 0.42,
+    "FNWI": 0.13,
+    "FdR": 0.07,
+    "AUC": 0.02,
+}
+# Bij Rechten: aandeel PPLE van de afdelingen
+AANDEEL_PPLE = 0.15
+
+FUNCTIES = ["Docent 1", "Docent 2", "Docent 3", "Docent 4"]
+AANDEEL_FUNCTIES = [0.02, 0.08, 0.32, 0.58]
+
+KWALIFICATIES = [
+    "Geen",
+    "Basiskwalificatie Onderwijs (BKO)",
+    "Seniorkwalificatie Onderwijs (SKO)",
+    "Vrijstelling",
+    "Onderwijskundig leiderschap (OLS)",
+]
+AANDEEL_KWALIFICATIES = [0.55, 0.40, 0.04, 0.008, 0.002]
+
+DOCENTEN_PER_SCHAAL = 2000
+
+
+def genereer(schaal=1, jaren=(2020, 2021, 2022), seed=0):
+    """Een synthetische export van ongeveer schaal x de echte omvang."""
+    rng = np.random.default_rng(seed)
+    n = int(DOCENTEN_PER_SCHAAL * schaal)
+    maanden = 12 * len(jaren)
+
+    # Per persoon: faculteit, begin en eind (in maanden vanaf januari van het
+    # eerste jaar), functie, dienstverband, FTE en kwalificatie
+    faculteiten = list(FACULTEITEN)
+    faculteit = rng.choice(len(faculteiten), n, p=list(FACULTEITEN.values()))
+    begin = rng.integers(-24, maanden, n)
+    eind = np.minimum(begin + rng.geometric(1 / 36, n), maanden)
+    begin = np.maximum(begin, 0)
+    # Wie voor het eerste jaar al weg was komt niet voor
+    eind = np.maximum(eind, begin)
+    lengte = eind - begin
+
+    functie = rng.choice(len(FUNCTIES), n, p=AANDEEL_FUNCTIES)
+    # Promotie (een niveau omhoog, Docent 4 -> Docent 3) op een maand in de aanstelling
+    promotie = np.where(
+        (rng.random(n) < 0.08) & (functie > 0), rng.integers(begin, eind + 1), maanden
+    )
+    vast = rng.random(n) < 0.45
+    # Omzetting van tijdelijk naar vast, met een nieuwe omvang
+    omzetting = np.where(
+        ~vast & (rng.random(n) < 0.15), rng.integers(begin, eind + 1), maanden
+    )
+    fte = np.round(rng.uniform(0.1, 1.0, n), 4)
+    fte_na_omzetting = np.round(np.minimum(fte + rng.uniform(0, 0.3, n), 1.0), 4)
+    kwalificatie = rng.choice(len(KWALIFICATIES), n, p=AANDEEL_KWALIFICATIES)
+    # Wie geen kwalificatie heeft haalt soms in een later jaar de BKO
+    bko_jaar = rng.integers(1, len(jaren) + 3, n)
+
+    # Van personen naar persoon-maanden
+    persoon = np.repeat(np.arange(n), lengte)
+    maand = (
+        np.arange(lengte.sum())
+        - np.repeat(np.cumsum(lengte) - lengte, lengte)
+        + np.repeat(begin, lengte)
+    )
+    jaar = maand // 12
+    omgezet = maand >= omzetting[persoon]
+    f = functie[persoon] - (maand >= promotie[persoon])
+    v = vast[persoon] | omgezet
+    waarde = np.where(omgezet, fte_na_omzetting[persoon], fte[persoon])
+    k = kwalificatie[persoon]
+    k = np.where((k == 0) & (jaar >= bko_jaar[persoon]), 1, k)
+
+    # Naar regels per (persoon, jaar, functie, dienstverband) met 12 maandkolommen
+    sleutel = ((persoon * len(jaren) + jaar) * len(FUNCTIES) + f) * 2 + v
+    sleutels, regel = np.unique(sleutel, return_inverse=True)
+    fte_maanden = np.full((len(sleutels), 12), np.nan)
+    fte_maanden[regel, maand % 12] = waarde
+    r_persoon = sleutels // (2 * len(FUNCTIES) * len(jaren))
+    r_jaar = sleutels // (2 * len(FUNCTIES)) % len(jaren)
+    r_functie = sleutels // 2 % len(FUNCTIES)
+    r_vast = (sleutels % 2).astype(bool)
+    r_kwalificatie = np.zeros(len(sleutels), dtype=int)
+    r_kwalificatie[regel] = k
+
+    regels = pd.DataFrame(
+        {
+            "faculteit": np.array(faculteiten)[faculteit[r_persoon]],
+            "Kalenderjaar": np.array(jaren)[r_jaar],
+            "Onderwijskwalificatie": np.array(KWALIFICATIES)[r_kwalificatie],
+            "Dienstverband": np.where(r_vast, "Uitbreiding", "Bezoldigd"),
+            "Functie": np.array(FUNCTIES)[r_functie],
+            "UvA personeelsnummer": 10_000_000 + r_persoon,
+        }
+    )
+    regels[d.MAANDEN] = fte_maanden
+
+    # Een deel heeft twee aanstellingen, die samen de FTE geven
+    gesplitst = regels[rng.random(len(regels)) < 0.1].copy()
+    deel = rng.uniform(0.2, 0.8, len(gesplitst))[:, None]
+    regels.loc[gesplitst.index, d.MAANDEN] = (
+        regels.loc[gesplitst.index, d.MAANDEN].to_numpy() * deel
+    )
+    gesplitst[d.MAANDEN] = gesplitst[d.MAANDEN].to_numpy() * (1 - deel)
+
+    # En wat regels met een onbekend dienstverband
+    onbekend = regels[rng.random(len(regels)) < 0.01].assign(Dienstverband="Onbekend")
+    regels = pd.concat([regels, gesplitst, onbekend], ignore_index=True)
+
+    export = pd.concat(
+        [
+            regels.assign(Organisatie=regels["faculteit"]),
+            regels.assign(Organisatie="wp " + regels["faculteit"]),
+            regels.assign(Organisatie=_afdelingen(regels)),
+        ],
+        ignore_index=True,
+    )
+    kolommen = [
+        "Organisatie",
+        "Kalenderjaar",
+        "Onderwijskwalificatie",
+        "Dienstverband",
+        "Functie",
+        "UvA personeelsnummer",
+    ]
+    return export[kolommen + d.MAANDEN]
+
+
+def _afdelingen(regels):
+    """Afdeling per regel: een vaste afdeling per persoon, bij Rechten een van
+    de afdelingen van Rechten of PPLE."""
+    persnr = regels["UvA personeelsnummer"].to_numpy()
+    afdeling = np.char.add(
+        np.char.add("Afd. ", regels["faculteit"].to_numpy().astype(str)),
+        (persnr % 3 + 1).astype(str),
+    )
+
+    rechten = regels["faculteit"].to_numpy() == "FdR"
+    keuze = pd.util.hash_array(persnr) % 1000 / 1000
+    rechten_afdeling = np.where(
+        keuze < AANDEEL_PPLE,
+        "Afd. PPLE",
+        np.array(d.RECHTEN)[(persnr % len(d.RECHTEN))],
+    )
+    return np.where(rechten, rechten_afdeling, afdeling)
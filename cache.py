@@ -0,0 +1,60 @@
+"""Kleine, thread-safe LRU cache voor de figuren van het dashboard."""
+
+from collections import OrderedDict
+import threading
+
+
+class LRUCache:
+    """Begrensde cache: bij een volle cache gaat het langst niet gebruikte item eruit.
+
+    Houdt ook bij hoe vaak er een hit of een miss was.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_compute(self, key, functie):
+        """Geef de waarde voor key, en reken die met functie() uit als hij er niet is."""
+        value = self.get(key)
+        if value is None:
+            # Buiten de lock rekenen, twee gelijktijdige misses rekenen dan allebei
+            value = functie()
+            self.put(key, value)
+        return value
+
+    def verwijder(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def verwijder_waar(self, voorwaarde):
+        """Verwijder alle items waarvan de key aan voorwaarde(key) voldoet."""
+        with self._lock:
+            for key in [key for key in self._data if voorwaarde(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -1,15 +1,45 @@
 # Run this app with `python simple_app.py` and
 # visit http://127.0.0.1:8050/ in your web browser.
 
-from dash import Dash, html, dcc, Output, Input
+import time
+
+# Hoe lang het importeren van het dashboard duurt, zie /metrics
+start_import = time.perf_counter()
+
+from dash import Dash, html, dcc, Output, Input, ClientsideFunction
+from flask import g, has_request_context
 import dash_bootstrap_components as dbc
 import dash_daq as daq
-import plotly.express as px
-import pandas as pd
-import numpy as np
-import docenten as d
+import copy
+import importlib.util
+import json
+import os
+import sys
+import threading
+import antwoorden
+import instellingen
+import metrics
+import profiel
+from cache import LRUCache
 import warnings
 
+
+def lui_importeren(naam):
+    """Importeer een module pas bij het eerste gebruik ervan. docenten en opslag
+    importeren pandas en plotly.express, die zijn pas bij de eerste callback nodig."""
+    if naam in sys.modules:
+        return sys.modules[naam]
+    spec = importlib.util.find_spec(naam)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[naam] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+d = lui_importeren("docenten")
+opslag = lui_importeren("opslag")
+
 warnings.filterwarnings("ignore")
 
 
@@ -23,10 +53,211 @@ app = Dash(
 )
 server = app.server
 
+
 # Data stuff first, app stuff below.
-# assume you have a "long-form" data frame
 # Data is read in after preprocessing and hashing.
-df = pd.read_csv("data/Docenten_2020-2022_hashed.csv")
+# Voor de layout is alleen de metadata nodig (functies, jaren, t/m wanneer), de
+# data zelf wordt pas bij de eerste callback of bij warmup() ingelezen.
+def huidige_map(pad):
+    """De directory van de huidige versie van de data, zoals opslag.huidige_map
+    maar zonder pandas te importeren: de versie in pad/HUIDIG (opslag.publiceer),
+    anders pad zelf."""
+    try:
+        with open(os.path.join(pad, "HUIDIG")) as f:
+            return os.path.join(pad, "versies", f.read().strip())
+    except (FileNotFoundError, NotADirectoryError):
+        return pad
+
+
+def lees_metadata(pad):
+    """De metadata.json naast de kolommen (zie opslag.py), zonder pandas of de
+    data. Een CSV heeft die niet, die wordt dan hier al helemaal ingelezen."""
+    global df
+    if os.path.isdir(pad):
+        with open(os.path.join(pad, "metadata.json")) as f:
+            return json.load(f)
+    df, metadata = opslag.lees(pad)
+    return metadata
+
+
+df = None
+metadata = lees_metadata(huidige_map(instellingen.DATAPAD))
+
+
+class Stand:
+    """Een versie van de data met alles wat het dashboard eruit berekent: de
+    aggregaten en de vooraf gemaakte figuren. Eenmaal gemaakt verandert een stand
+    niet meer; bij een nieuwe versie op schijf komt er een nieuwe voor in de
+    plaats, zie herlaad()."""
+
+    def __init__(self, map, df=None, metadata=None):
+        # De directory van deze versie (zie huidige_map), of de CSV: alles van
+        # deze stand komt daaruit. Zonder df (een CSV die lees_metadata al las)
+        # van schijf. Kolomformaat wordt gememory-mapt, dus inlezen kost vrijwel
+        # niets.
+        self.map = map
+        start = time.perf_counter()
+        if df is None:
+            df, metadata = opslag.lees(map)
+        metrics.LAADTIJD.zet(time.perf_counter() - start, "dataset")
+        self.df = df
+        self.metadata = metadata
+        # Versie van de data: alles wat hieruit berekend en bewaard wordt hangt hieraan
+        self.versie = metadata["versie"]
+        # De server maakt elk figuur over de hele periode, het tijdvak van de
+        # Jaarslider snijdt de browser eruit (assets/jaarfilter.js)
+        self.volledig = (min(metadata["jaren"]), max(metadata["jaren"]))
+
+        # Alle aggregaten eenmalig, de callback snijdt hier alleen nog in.
+        # Bij voorkeur de bewaarde aggregaten van deze versie van de data.
+        start = time.perf_counter()
+        self.kubus = opslag.lees_kubus(map, self.versie)
+        if self.kubus is None:
+            self.kubus = d.bouw_kubus(df)
+        metrics.LAADTIJD.zet(time.perf_counter() - start, "kubus")
+        # Het "alle docenten" panel hangt niet af van de gekozen Functie
+        self.alle_docenten = d.percentages_docenten_kubus(self.kubus)
+
+        # Vooraf gemaakte figuren (prerender.py), als JSON per figuur_sleutel. Die
+        # horen bij deze data en bij deze versie van de figuren.
+        self.figuren_versie = (
+            f"{self.versie}-{opslag.bron_versie(d.__file__, __file__)}"
+        )
+        start = time.perf_counter()
+        self.voorraad = opslag.lees_figuren(map, self.figuren_versie)
+        metrics.LAADTIJD.zet(time.perf_counter() - start, "figuren")
+
+    def met_voorraad(self, voorraad):
+        """Dezelfde stand met andere vooraf gemaakte figuren: prerender.py draait
+        na prepare_public.py, dus die kunnen later komen. De stand zelf blijft
+        zoals hij is, lopende requests kunnen hem gebruiken."""
+        nieuw = copy.copy(self)
+        nieuw.voorraad = voorraad
+        return nieuw
+
+
+# De stand die nu gebruikt wordt, ingelezen door laad() en vervangen door herlaad()
+huidig = None
+laad_lock = threading.Lock()
+
+
+def laad():
+    """De huidige stand van de data, de eerste keer ingelezen."""
+    global huidig
+    if huidig is None:
+        with laad_lock:
+            if huidig is None:
+                if df is None:
+                    huidig = Stand(huidige_map(instellingen.DATAPAD))
+                else:
+                    huidig = Stand(instellingen.DATAPAD, df, metadata)
+    return huidig
+
+
+def stand():
+    """De stand voor dit request: vastgelegd bij het eerste gebruik in een request,
+    zodat een herlaad halverwege niet de helft van het antwoord verandert."""
+    if not has_request_context():
+        return laad()
+    if "stand" not in g:
+        g.stand = laad()
+    return g.stand
+
+
+# De analyses van een Functie over de hele periode, per (versie van de data,
+# Functie, analyse), zie tabel().
+tabellen_cache = LRUCache(maxsize=instellingen.FIGUUR_CACHE_GROOTTE)
+# Eenmaal gemaakte figuren, per figuur een cache op (versie van de data, invoer)
+figuur_cache = {}
+
+
+def antwoord_versie():
+    """Versie van de antwoorden op de callbacks: de data en de code van de figuren."""
+    return stand().figuren_versie
+
+
+# De antwoorden op de callbacks als (gecomprimeerde) bytes, met een ETag. Niet
+# bij profileren, dan moet de callback echt draaien.
+antwoord_cache = antwoorden.koppel(
+    server,
+    antwoord_versie,
+    overslaan=profiel.actief,
+    maxsize=instellingen.FIGUUR_CACHE_GROOTTE,
+)
+
+
+def cache_stand(teller):
+    """Hits of misses van alle caches, voor /metrics."""
+    caches = {("antwoorden",): antwoord_cache, ("tabellen",): tabellen_cache}
+    caches.update({(naam,): cache for naam, cache in figuur_cache.items()})
+    return {naam: getattr(cache, teller) for naam, cache in caches.items()}
+
+
+metrics.Waarde(
+    "docenten_cache_hits_total",
+    "Hits van de caches van het dashboard",
+    ["cache"],
+    soort="counter",
+    functie=lambda: cache_stand("hits"),
+)
+metrics.Waarde(
+    "docenten_cache_misses_total",
+    "Misses van de caches van het dashboard",
+    ["cache"],
+    soort="counter",
+    functie=lambda: cache_stand("misses"),
+)
+metrics.koppel(server)
+
+
+def herlaad():
+    """Lees de data opnieuw in als er op schijf een nieuwe versie is (de
+    inhoudshash in metadata.json van de huidige versie, zie huidige_map) en wissel
+    dan in een keer om. Lopende requests houden hun stand (zie stand()), volgende
+    krijgen de nieuwe. Daarna gaat uit de caches alles van een andere versie.
+    Geeft of er gewisseld is."""
+    global huidig
+    oud = laad()
+    map = huidige_map(instellingen.DATAPAD)
+    if lees_metadata(map)["versie"] == oud.versie:
+        if not oud.voorraad:
+            # prerender.py draait na prepare_public.py: de figuren kunnen later komen
+            voorraad = opslag.lees_figuren(oud.map, oud.figuren_versie)
+            if voorraad:
+                huidig = oud.met_voorraad(voorraad)
+        return False
+
+    start = time.perf_counter()
+    nieuw = Stand(map)
+    # Een directory zonder versies (schrijf_kolommen) kan tijdens het inlezen
+    # opnieuw geschreven zijn: de volgende keer opnieuw proberen
+    if lees_metadata(map)["versie"] != nieuw.versie:
+        return False
+    huidig = nieuw
+    for cache in [tabellen_cache, *figuur_cache.values()]:
+        cache.verwijder_waar(lambda sleutel: sleutel[0] != nieuw.versie)
+    antwoord_cache.verwijder_waar(lambda sleutel: sleutel[0] != nieuw.figuren_versie)
+    metrics.LAADTIJD.zet(time.perf_counter() - start, "herladen")
+    return True
+
+
+def bewaak():
+    """Start een achtergrondthread die elke DOCENTEN_HERLAAD seconden herlaad()
+    aanroept, zie gunicorn.conf.py. Alleen voor het kolomformaat."""
+    if not instellingen.HERLAAD or not os.path.isdir(instellingen.DATAPAD):
+        return
+
+    def bewaken():
+        while True:
+            time.sleep(instellingen.HERLAAD)
+            try:
+                if herlaad():
+                    server.logger.info("Nieuwe data ingelezen: %s", huidig.versie)
+            except Exception:
+                server.logger.exception("Herladen van %s mislukt", instellingen.DATAPAD)
+
+    threading.Thread(target=bewaken, name="herlaad", daemon=True).start()
+
 
 # Mapping voor promoties
 prom_map = {
@@ -36,9 +267,32 @@ prom_map = {
     "Docent 1": "Docent 1",
 }
 
+# Voor "De data is up-to-date t/m ..." in de sidebar
+MAANDNAMEN = [
+    "jan.",
+    "feb.",
+    "mrt.",
+    "apr.",
+    "mei",
+    "jun.",
+    "jul.",
+    "aug.",
+    "sept.",
+    "okt.",
+    "nov.",
+    "dec.",
+]
+
+
+def tot_en_met(data_tm):
+    """ "2022-09" -> "sept. '22" """
+    jaar, maand = data_tm.split("-")
+    return f"{MAANDNAMEN[int(maand) - 1]} '{jaar[2:]}"
+
+
 # Function to filter on years, while date is in quarters.
 def filterdatum(plot_df, jaren):
-    Qjaren = [f"{jaren[0]} Q1", f"{jaren[1]} Q4"]
+    Qjaren = [d.datum_ordinaal(jaren[0], 1), d.datum_ordinaal(jaren[1], 12)]
     plot_df = plot_df[((plot_df.Datum >= Qjaren[0]) & (plot_df.Datum <= Qjaren[1]))]
     return plot_df
 
@@ -84,56 +338,64 @@ CONTENT_STYLE = {
 
 # Create content
 
-sidebar = html.Div(
-    [
-        html.H1("UvA Docentenbeleid"),
-        html.Hr(),
-        html.H5("Kies hier de populatie!"),
-        dcc.Dropdown(
-            id="Functie",
-            value="Docent 4",
-            options=[{"label": x, "value": x} for x in df.Functie.unique()],
-            multi=False,
-            optionHeight=75,
-            style={"margin-bottom": "50px"},
-        ),
-        html.H5("Welk tijdvak wil je zien?"),
-        dcc.RangeSlider(
-            df.Kalenderjaar.min(),
-            df.Kalenderjaar.max(),
-            1,
-            marks={
-                i: f"{i}"
-                for i in range(df.Kalenderjaar.min(), df.Kalenderjaar.max() + 1)
-            },
-            value=[2021, 2022],
-            id="Jaarslider",
-        ),
-        html.Hr(),
-        html.Div(
-            "Dit dashboard bevat visualisaties ter monitoring van het docentenbeleid."
-        ),
-        html.Div(
-            "Elk panel is interactief, klikken op items in de legenda geeft de mogelijkheid slechts een deel van de data weer te geven."
-        ),
-        html.Div(
-            "De groep docenten waar het om gaat, zowel als de jaren die je wilt zien kies je hierboven."
-        ),
-        html.Div("De data is up-to-date t/m sept. '22."),
-        html.Div(
-            "De bovenste panels tonen verhoudingen tussen en omzettingen van docentniveaus. Het rechter panel is statisch, het linker toont omzettingen van de gekozen populatie naar één niveau hoger."
-        ),
-        html.Div(
-            "De middelste panels tonen het percentage vaste dienstverbanden (links; met de switch kies je tussen head count en FTE) en de omzetting van tijdelijk naar vast (rechts)."
-        ),
 
-        html.Div(
-            "Het onderste panel laat de omvang van dienstverbanden zien in een boxplot. De balkjes geven aan waar de bulk van de docenten zit en het horizontale streepje is de mediaan. Vergrotingen van contractomvang bij veel docenten uiten zich als een verschuiving van de balkjes en mediaan omhoog."
-        ),
-    ],
-    style=SIDEBAR_STYLE,
-    id="sidebar",
-)
+def maak_sidebar(metadata):
+    """De sidebar met de keuzes en de tekst bij de functies, jaren en data_tm uit
+    metadata. Per pagina een nieuwe, zie pagina()."""
+    return html.Div(
+        [
+            html.H1("UvA Docentenbeleid"),
+            html.Hr(),
+            html.H5("Kies hier de populatie!"),
+            dcc.Dropdown(
+                id="Functie",
+                value="Docent 4",
+                options=[{"label": x, "value": x} for x in metadata["functies"]],
+                multi=False,
+                optionHeight=75,
+                style={"margin-bottom": "50px"},
+            ),
+            html.H5("Welk tijdvak wil je zien?"),
+            dcc.RangeSlider(
+                min(metadata["jaren"]),
+                max(metadata["jaren"]),
+                1,
+                marks={
+                    i: f"{i}"
+                    for i in range(min(metadata["jaren"]), max(metadata["jaren"]) + 1)
+                },
+                value=[2021, 2022],
+                id="Jaarslider",
+            ),
+            html.Hr(),
+            html.Div(
+                "Dit dashboard bevat visualisaties ter monitoring van het docentenbeleid."
+            ),
+            html.Div(
+                "Elk panel is interactief, klikken op items in de legenda geeft de mogelijkheid slechts een deel van de data weer te geven."
+            ),
+            html.Div(
+                "De groep docenten waar het om gaat, zowel als de jaren die je wilt zien kies je hierboven."
+            ),
+            html.Div(
+                f"De data is up-to-date t/m {tot_en_met(metadata['data_tm'])}.",
+                id="data-tm",
+            ),
+            html.Div(
+                "De bovenste panels tonen verhoudingen tussen en omzettingen van docentniveaus. Het rechter panel is statisch, het linker toont omzettingen van de gekozen populatie naar één niveau hoger."
+            ),
+            html.Div(
+                "De middelste panels tonen het percentage vaste dienstverbanden (links; met de switch kies je tussen head count en FTE) en de omzetting van tijdelijk naar vast (rechts)."
+            ),
+
+            html.Div(
+                "Het onderste panel laat de omvang van dienstverbanden zien in een boxplot. De balkjes geven aan waar de bulk van de docenten zit en het horizontale streepje is de mediaan. Vergrotingen van contractomvang bij veel docenten uiten zich als een verschuiving van de balkjes en mediaan omhoog."
+            ),
+        ],
+        style=SIDEBAR_STYLE,
+        id="sidebar",
+    )
+
 
 content = html.Div(
     [
@@ -206,64 +468,184 @@ NAVBAR = dbc.Navbar(
 )
 
 
-# HERE WE BUILT THE APP LAYOUT
-app.layout = html.Div([content, sidebar, NAVBAR])  #
-
-
-# any change to the input Fuel will call the update_figure function and return a figure with updated data
-@app.callback(
-    Output("graph_vast", "figure"),
-    Output("graph_alle_docenten", "figure"),
-    Output("graph_tijdelijkvast", "figure"),
-    Output("graph_promotie", "figure"),
-    Output("graph_fte_dist", "figure"),
-    Input("Functie", "value"),
-    Input("Jaarslider", "value"),
-    Input("fte-hc-switch", "on"),
-)
-def update_figure_table(Functie, jaren, ftehc):
-    # If no function selected, make it Docent 4
-    if not Functie:
-        Functie = "Docent 4"
+def figuur(naam, argumenten):
+    """Het figuur uit de voorraad van prerender.py, of anders live gemaakt."""
+    maak, _ = FIGUREN[naam]
+    opgeslagen = stand().voorraad.get(opslag.figuur_sleutel(naam, *argumenten))
+    if opgeslagen is not None:
+        with metrics.FIGUREN.tijd(naam, "voorraad"):
+            return json.loads(opgeslagen)
+    with metrics.FIGUREN.tijd(naam, "live"):
+        return maak(*argumenten)
+
+
+def live(naam, argumenten):
+    """Het figuur helemaal opnieuw uitgerekend, zonder caches en voorraad, om
+    te profileren."""
+    maak, afhankelijk = FIGUREN[naam]
+    if "Functie" in afhankelijk:
+        Functie = argumenten[afhankelijk.index("Functie")]
+        for tabel_naam in ANALYSES:
+            tabellen_cache.verwijder((stand().versie, Functie, tabel_naam))
+    return maak(*argumenten)
+
+
+# De analyse achter elk panel, voor een Functie over de hele periode
+ANALYSES = {
+    "vast_hc": lambda kubus, Functie: d.perc_vast_kubus(
+        kubus, functie=Functie, maat="headcount"
+    ),
+    "vast_fte": lambda kubus, Functie: d.perc_vast_kubus(
+        kubus, functie=Functie, maat="fte"
+    ),
+    "tijdelijkvast": lambda kubus, Functie: d.tijdelijk_vast_kubus(
+        kubus, functie=Functie
+    ),
+    "promotie": lambda kubus, Functie: d.promotie_kubus(
+        kubus, van=Functie, naar=prom_map[Functie]
+    ),
+    "fte_dist": lambda kubus, Functie: d.fte_dist_kubus(kubus, functie=Functie),
+}
 
-    # Jaren pas filteren voor de plot, niet voor analyse!
-    filtered_df = df[df.Functie == Functie]
-    two_func_df = df[df.Functie.isin([Functie, prom_map[Functie]])]
 
+def tabel(Functie, naam):
+    """De analyse naam voor Functie over de hele periode, eenmaal per Functie.
+    De jaren worden pas per figuur gefilterd. Elk panel is een eigen callback
+    (en request), dus alleen de analyse van dit panel: de andere rekent de
+    callback van dat panel tegelijk uit, in een andere worker."""
+    s = stand()
+    return tabellen_cache.get_or_compute(
+        (s.versie, Functie, naam), lambda: ANALYSES[naam](s.kubus, Functie)
+    )
+
+
+# Jaren pas filteren voor de plot, niet voor analyse!
+def figuur_vast(Functie, jaren, ftehc):
     if ftehc:
-        plot_df = d.perc_vast_FTE(filtered_df, functie=Functie, plot=False).pipe(
-            filterdatum, jaren
+        plot_df = tabel(Functie, "vast_fte").pipe(filterdatum, jaren)
+        return d.plot_pvast(plot_df, functie=Functie)
+    plot_df = tabel(Functie, "vast_hc").pipe(filterdatum, jaren)
+    return d.plot_pvast_hc(plot_df, functie=Functie)
+
+
+def figuur_alle_docenten(jaren):
+    plot_df = stand().alle_docenten.pipe(filterdatum, jaren)
+    return d.plot_percentages_docenten(plot_df)
+
+
+def figuur_tijdelijkvast(Functie, jaren):
+    plot_df = tabel(Functie, "tijdelijkvast").pipe(filterdatum, jaren)
+    return d.plot_vasttijdelijk(plot_df, functie=Functie)
+
+
+def figuur_promotie(Functie, jaren):
+    plot_df = tabel(Functie, "promotie").pipe(filterdatum, jaren)
+    return d.plot_promoties(plot_df, van=Functie, naar=prom_map[Functie])
+
+
+def figuur_fte_dist(Functie, jaren):
+    plot_df = tabel(Functie, "fte_dist").pipe(filterdatum, jaren)
+    return d.plot_fte_dist(plot_df, functie=Functie)
+
+
+# Per figuur de functie die hem maakt en de invoer waar hij van afhangt.
+# Elk figuur heeft een eigen callback met alleen die invoer, zodat bijv. de
+# switch alleen graph_vast opnieuw maakt. prerender.py maakt hiermee alle
+# figuren vooraf.
+FIGUREN = {
+    "graph_vast": (figuur_vast, ["Functie", "jaren", "ftehc"]),
+    "graph_alle_docenten": (figuur_alle_docenten, ["jaren"]),
+    "graph_tijdelijkvast": (figuur_tijdelijkvast, ["Functie", "jaren"]),
+    "graph_promotie": (figuur_promotie, ["Functie", "jaren"]),
+    "graph_fte_dist": (figuur_fte_dist, ["Functie", "jaren"]),
+}
+
+# Waar de invoer in de layout vandaan komt
+INVOER = {
+    "Functie": Input("Functie", "value"),
+    "jaren": Input("Jaarslider", "value"),
+    "ftehc": Input("fte-hc-switch", "on"),
+}
+
+
+def schoon(invoer, waarde):
+    """Maak de waarde uit de browser eenduidig (en hashbaar voor de cache)."""
+    if invoer == "Functie":
+        # If no function selected, make it Docent 4
+        return waarde or "Docent 4"
+    if invoer == "jaren":
+        return tuple(waarde)
+    return bool(waarde)
+
+
+def registreer(naam):
+    """Per figuur: een dcc.Store met het figuur over de hele periode, gevuld door
+    een callback op de invoer behalve de jaren, en een clientside callback die
+    daaruit het gekozen tijdvak laat zien."""
+    _, afhankelijk = FIGUREN[naam]
+    server_invoer = [a for a in afhankelijk if a != "jaren"]
+    figuur_cache[naam] = LRUCache(maxsize=instellingen.FIGUUR_CACHE_GROOTTE)
+
+    def update_figuur(*waarden):
+        with metrics.CALLBACKS.tijd(naam):
+            s = stand()
+            invoer = dict(zip(server_invoer, waarden), jaren=s.volledig)
+            argumenten = [schoon(a, invoer[a]) for a in afhankelijk]
+            if profiel.actief():
+                return profiel.profileer(
+                    naam,
+                    dict(zip(afhankelijk, argumenten)),
+                    lambda: live(naam, argumenten),
+                )
+            return figuur_cache[naam].get_or_compute(
+                (s.versie, *argumenten), lambda: figuur(naam, argumenten)
+            )
+
+    volledig = dcc.Store(id=f"{naam}-volledig")
+    if server_invoer:
+        content.children.append(volledig)
+        app.callback(Output(volledig.id, "data"), *[INVOER[a] for a in server_invoer])(
+            update_figuur
         )
-        fig_vast = d.plot_pvast(plot_df, functie=Functie)
     else:
-        plot_df = d.perc_vast_HC(filtered_df, functie=Functie, plot=False).pipe(
-            filterdatum, jaren
-        )
-        fig_vast = d.plot_pvast_hc(plot_df, functie=Functie)
+        # Hangt alleen van de jaren af: meteen gevuld in de layout, zie pagina()
+        in_layout.append((volledig.id, update_figuur))
+
+    app.clientside_callback(
+        ClientsideFunction(namespace="docenten", function_name="jaarfilter"),
+        Output(naam, "figure"),
+        Input(volledig.id, "data"),
+        INVOER["jaren"],
+    )
 
-    plot_df = d.percentages_docenten(df, plot=False).pipe(filterdatum, jaren)
-    fig_alledocenten = d.plot_percentages_docenten(plot_df)
+    return update_figuur
 
-    plot_df = d.tijdelijk_vast(filtered_df, functie=Functie, plot=False).pipe(
-        filterdatum, jaren
-    )
-    fig_tijdelijkvast = d.plot_vasttijdelijk(plot_df, functie=Functie)
-
-    plot_df = d.promotie(
-        two_func_df, van=Functie, naar=prom_map[Functie], plot=False
-    ).pipe(filterdatum, jaren)
-    fig_promotie = d.plot_promoties(plot_df, van=Functie, naar=prom_map[Functie])
-
-    plot_df = d.fte_dist(df, functie=Functie, plot=False).pipe(filterdatum, jaren)
-    fig_fte_dist = d.plot_fte_dist(plot_df, functie=Functie)
-
-    return (
-        fig_vast,
-        fig_alledocenten,
-        fig_tijdelijkvast,
-        fig_promotie,
-        fig_fte_dist,
-    )
+
+# Stores die bij het serveren van de pagina al gevuld worden
+in_layout = []
+update_figuren = {naam: registreer(naam) for naam in FIGUREN}
+
+
+# HERE WE BUILT THE APP LAYOUT
+def pagina():
+    """De layout, met de figuren die niet van een server callback afhangen erin.
+    Een functie, zodat die pas bij de eerste pagina (of warmup) gemaakt worden,
+    en de keuzes na een herlaad bij de nieuwe data passen. Elke keer een nieuwe
+    sidebar en nieuwe Stores uit de stand van dit request: pagina's kunnen
+    tegelijk gemaakt worden, ook tijdens een herlaad."""
+    s = stand()
+    gevuld = [dcc.Store(id=id, data=update_figuur()) for id, update_figuur in in_layout]
+    return html.Div([content, *gevuld, maak_sidebar(s.metadata), NAVBAR])
+
+
+def warmup():
+    """Alles inlezen en klaarzetten voor de eerste gebruiker, zie gunicorn.conf.py."""
+    laad()
+    pagina()
+
+
+app.layout = pagina
+metrics.LAADTIJD.zet(time.perf_counter() - start_import, "import")
 
 
 if __name__ == "__main__":
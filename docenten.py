@@ -1,37 +1,169 @@
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+import tempfile
+import warnings
 import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 
+import instellingen
+import metrics
+
 # Code for processing the docentendata such that plots below can be easily made.
 # Functions appear here i the same order as in the notebook
 
-
-def hash_nr(df, columns):
-    """Hash a column using md5.
+# Kolommen met een klein, vast aantal waarden. Geordend categorisch,
+# dan sorteert groupby(observed=True) ook in pandas < 2.
+CATEGORISCH = [
+    "Organisatie",
+    "Functie",
+    "Dienstverband",
+    "Onderwijskwalificatie",
+    "kwartaal",
+]
+KWARTALEN = pd.CategoricalDtype(["Q1", "Q2", "Q3", "Q4"], ordered=True)
+
+# De maandkolommen in de export uit UvA Data
+MAANDEN = [f"{maand:02d}" for maand in range(1, 13)]
+
+# Volgorde van de maanddata zoals preprocess die geeft
+SORTERING = [
+    "Organisatie",
+    "persnr",
+    "Functie",
+    "Kalenderjaar",
+    "maand",
+    "Dienstverband",
+]
+
+# Afdelingen van Rechten zonder PPLE, die samen FdR vormen
+RECHTEN = [
+    "Afd. Privaatrecht",
+    "Afd.Int./Eur.Recht",
+    "wp afd. Alg. Recht",
+    "wp afd. Publiekrecht",
+]
+
+
+def hash_nr(df, columns, sleutel=None):
+    """Hash a column with keyed BLAKE2b.
     If columns is a list, they're all done,
-    if it's a string, taht column is hashed.
+    if it's a string, that column is hashed.
 
-    The column will be converted to strings first, otherwise the hash is identical.
+    The values are converted to strings first, then every distinct value is
+    hashed once with the key and the result (int64) is spread over the rows.
+    The same key gives the same hashes in every run and every delivery, so
+    persnrs can be matched across deliveries without being reversible.
+    Without sleutel the key comes from DOCENTEN_HASH_SLEUTEL (instellingen.py).
 
     The same DataFrame will be returned with hashed columns
     """
+    if sleutel is None:
+        sleutel = instellingen.HASH_SLEUTEL
+    if not sleutel:
+        raise ValueError(
+            "geen sleutel om te hashen: geef sleutel mee of zet DOCENTEN_HASH_SLEUTEL"
+        )
 
     if type(columns) == str:
-        df[columns] = df[columns].apply(str).apply(hash)
+        df[columns] = _hash_kolom(df[columns], sleutel)
     elif type(columns) == list:
         for col in columns:
-            df[col] = df[col].apply(str).apply(hash)
+            df[col] = _hash_kolom(df[col], sleutel)
     else:
         print("Don't recognize the type of columns, nothing is hashed")
 
     return df
 
 
+def _hash_kolom(kolom, sleutel):
+    # blake2b accepteert sleutels tot 64 bytes, zo kan de sleutel elke lengte hebben
+    sleutel = hashlib.blake2b(sleutel.encode()).digest()
+    codes, uniek = pd.factorize(kolom)
+    # Het eerste blok (de sleutel) is voor elke waarde hetzelfde: 1 keer, daarna
+    # een kopie per waarde. BLAKE2b per waarde blijft een Python-lus: rond 1
+    # miljoen unieke waarden per seconde, afhankelijk van de machine.
+    gesleuteld = hashlib.blake2b(key=sleutel, digest_size=8)
+
+    def hash_waarde(waarde):
+        h = gesleuteld.copy()
+        h.update(str(waarde).encode())
+        return h.digest()
+
+    hashes = np.fromiter(map(hash_waarde, uniek), dtype="S8", count=len(uniek))
+    return pd.Series(hashes.view(">i8").astype("int64")[codes], index=kolom.index)
+
+
+def sleutel_id(sleutel):
+    """Korte vingerafdruk van de hash-sleutel, om te zien of twee leveringen met
+    dezelfde sleutel gehasht zijn (zonder de sleutel zelf te bewaren)."""
+    return hashlib.blake2b(sleutel.encode(), person=b"sleutel_id").hexdigest()[:12]
+
+
 def preprocess(df, faculteiten=["FGw", "FMG", "FdR", "FNWI", "FEB"]):
     # General preprocessing that always happens.
+    return compact(_naar_maanden(_aggregeer_export(df, faculteiten)))
+
+
+def _aggregeer_export(df, faculteiten):
+    """Eerste stap van preprocess: van de regels uit de export naar 1 regel per
+    (Organisatie, persnr, Functie, Kalenderjaar, Dienstverband), met de FTEs per maand
+    en de hoogste Onderwijskwalificatie.
+    Dit zijn sommen en maxima, dus stukken van de export kunnen apart
+    geaggregeerd en later met _combineer samengevoegd worden.
+    """
     df = df.rename(columns={"UvA personeelsnummer": "persnr"})
+    organisatie = _organisaties(df["Organisatie"], faculteiten)
+
+    # Alleen de faculteiten, zonder onbekende dienstverbanden
+    # en zonder regels waar een van de sleutels ontbreekt.
+    sleutels = ["Functie", "persnr", "Kalenderjaar", "Dienstverband"]
+    rijen = (
+        organisatie.isin(faculteiten)
+        & (df["Dienstverband"] != "Onbekend")
+        & df[sleutels + ["Onderwijskwalificatie"]].notna().all(axis=1)
+    )
+    df = df[rijen]
+
+    # Onderwijskwalificatie als geordende categorie: "Geen" is het laagst,
+    # dan is het hoogste niveau gewoon de max van de codes.
+    kwalificaties = df["Onderwijskwalificatie"].astype(
+        kwalificatie_type(df["Onderwijskwalificatie"])
+    )
+
+    # Tel FTEs per "omvang dienstverband" en over de kwalificaties bij elkaar op,
+    # in 1 groupby. De som slaat NaN over, dus x+NaN = x.
+    # Hernoem Bezoldigd en Uitbreiding naar Tijdelijk en Vast.
+    df = pd.DataFrame(
+        {
+            "Organisatie": organisatie[rijen],
+            # Een lege cel maakt de kolom float64, in een ander stuk van de export
+            # is hij int64: gelijk maken, anders hasht preprocess_stroom dezelfde
+            # persoon naar een andere partitie
+            "persnr": df["persnr"].astype("int64"),
+            "Functie": df["Functie"],
+            "Kalenderjaar": df["Kalenderjaar"],
+            "Dienstverband": df["Dienstverband"].replace(
+                {"Bezoldigd": "Tijdelijk", "Uitbreiding": "Vast"}
+            ),
+            "kwalificatie": kwalificaties.cat.codes,
+        }
+    ).join(df[MAANDEN])
+    df = df.groupby(
+        ["Organisatie", "persnr", "Functie", "Kalenderjaar", "Dienstverband"]
+    ).agg({**{maand: "sum" for maand in MAANDEN}, "kwalificatie": "max"})
+    df["Onderwijskwalificatie"] = pd.Categorical.from_codes(
+        df.pop("kwalificatie"), dtype=kwalificaties.dtype
+    )
 
+    return df
+
+
+def _organisaties(organisatie, faculteiten):
+    """De Organisatie van elke regel van de export zoals preprocess die gebruikt.
+    Per regel, dus ook op een deel van de export hetzelfde."""
     ### Voor Rechten: PPLE eruit ###############
     # De data heeft 3 niveaus voor de orgnaisatie:
     # faculteit, WP faculteit en dan de afdelingen.
@@ -41,143 +173,356 @@ def preprocess(df, faculteiten=["FGw", "FMG", "FdR", "FNWI", "FEB"]):
     # - Verwijder hoge niveau rechten en de lage-niveau regels met PPLE
     # - Hernoem alle andere lage niveaus naar topniveau,
     #   zodat later bij de selectie al deze mensen blijven.
-
     if "PPLE" in faculteiten:
         # Voor PPLE apart in de output
-        df.replace("Afd. PPLE", "PPLE", inplace=True)
+        organisatie = organisatie.replace("Afd. PPLE", "PPLE")
 
     if "FdR" in faculteiten:
-        # Rechten is een geval apart: PPLE moet eruit
-        rechten = [
-            "Afd. Privaatrecht",
-            "Afd.Int./Eur.Recht",
-            "wp afd. Alg. Recht",
-            "wp afd. Publiekrecht",
-        ]
+        # Rechten is een geval apart: PPLE moet eruit.
+        # Regels op het hoge niveau eruit, zodat de lager-niveau regels
+        # zonder PPLE hernoemd kunnen worden
+        organisatie = organisatie.mask(organisatie == "FdR").replace(RECHTEN, "FdR")
 
-        # Deze regels eruit, zodat de lager-niveau regels zonder PPLE hernoemd kan worden
-        df = df[df.Organisatie != "FdR"]
-        df.replace(rechten, "FdR", inplace=True)
+    return organisatie
 
-    df = df[df["Organisatie"].isin(faculteiten)]
 
-    # Hernoem Bezoldigd en UItbreiding naar Tijdelijk en Vast.
-    df = df.replace(["Bezoldigd", "Uitbreiding"], ["Tijdelijk", "Vast"])
-    # Tel FTEs per "omvang dienstverband" bij elkaar op,
-    # nansum, want anders wordt x+NaN = NaN, nu x+NaN = x
-    df = df.groupby(
+def _combineer(delen):
+    """Voeg deel-aggregaten van _aggregeer_export samen: FTEs optellen,
+    hoogste kwalificatie nemen. Elk deel mag andere kwalificaties kennen.
+    """
+    kwalificaties = kwalificatie_type(
+        pd.Series(
+            np.concatenate(
+                [deel["Onderwijskwalificatie"].cat.categories for deel in delen]
+            )
+        )
+    )
+    df = pd.concat(
         [
-            "Organisatie",
-            "Kalenderjaar",
-            "Onderwijskwalificatie",
-            "Dienstverband",
-            "Functie",
-            "persnr",
-        ],
-        as_index=False,
-    ).agg(np.nansum)
+            deel.assign(
+                Onderwijskwalificatie=deel["Onderwijskwalificatie"]
+                .astype(kwalificaties)
+                .cat.codes
+            )
+            for deel in delen
+        ]
+    )
+    df = df.groupby(level=list(range(df.index.nlevels))).agg(
+        {**{maand: "sum" for maand in MAANDEN}, "Onderwijskwalificatie": "max"}
+    )
+    df["Onderwijskwalificatie"] = pd.Categorical.from_codes(
+        df["Onderwijskwalificatie"], dtype=kwalificaties
+    )
+
+    return df
 
-    # Naar long format waarin alle maanden voorkomen,
-    # maak daar integers van en construeer kwartalen
-    df_long = pd.melt(
-        df,
-        id_vars=[
-            "Organisatie",
-            "Kalenderjaar",
-            "Onderwijskwalificatie",
-            "Dienstverband",
-            "Functie",
-            "persnr",
-        ],
-        value_vars=[
-            "01",
-            "02",
-            "03",
-            "04",
-            "05",
-            "06",
-            "07",
-            "08",
-            "09",
-            "10",
-            "11",
-            "12",
-        ],
-        var_name="maand",
-        value_name="fte",
-    )
-    df_long["maand"] = df_long["maand"].astype(int)
-
-    # Onderwijskwalificatie aggregeren naar hoogste niveau,
-    # FTEs optellen over de kwalificaties
-    df_long.replace("Geen", "AAGeen", inplace=True)  # (voor aggregatie, zie onder)
-    df_long = df_long.groupby(
-        ["Organisatie", "Functie", "persnr", "Kalenderjaar", "maand", "Dienstverband"],
-        as_index=False,
-    ).agg({"Onderwijskwalificatie": "max", "fte": "sum"})
-    df_long.replace("AAGeen", "Geen", inplace=True)
-
-    kwartaal = {
-        1: "Q1",
-        2: "Q1",
-        3: "Q1",
-        4: "Q2",
-        5: "Q2",
-        6: "Q2",
-        7: "Q3",
-        8: "Q3",
-        9: "Q3",
-        10: "Q4",
-        11: "Q4",
-        12: "Q4",
-    }
-    df_long["kwartaal"] = df_long.maand.map(kwartaal)
-    df_long = df_long.dropna()  # Many NaN FTE, meaning 0.
-    # Onbekende dienstverbanden, en maanden zonder dienstbetrekking eruit
-    # Alleen precies 0 eruit, soms negatief = correctie op ander dienstverband?
-    df_long = df_long[((df_long.fte != 0) & (df_long.Dienstverband != "Onbekend"))]
 
-    df_long["Datum"] = (
-        df_long["Kalenderjaar"].astype(str) + " " + df_long["kwartaal"].astype(str)
+def _naar_maanden(df):
+    """Tweede stap van preprocess: naar long format, 1 regel per persoon per maand
+    met een dienstbetrekking, gesorteerd op Organisatie, persnr, Functie en datum.
+    """
+    kwalificaties = df["Onderwijskwalificatie"].dtype
+    df = df.assign(kwalificatie=df.pop("Onderwijskwalificatie").cat.codes)
+
+    # Dienstverband naar de kolommen: per (Organisatie, persnr, Functie, Kalenderjaar)
+    # staat er dan een (maand, Dienstverband) blok, dat met een reshape in
+    # 1 keer naar long format gaat, al in de volgorde van de uiteindelijke sortering.
+    df = df.unstack("Dienstverband")
+    if df.empty:
+        # Geen regels (een lege export, of alles weggefilterd): unstack verliest
+        # dan de kolommen, er zijn geen dienstverbanden en FTEs
+        dienstverbanden = fte = kwalificatie = np.array([])
+    else:
+        dienstverbanden = df["kwalificatie"].columns.to_numpy()
+        fte = df[MAANDEN].to_numpy(dtype="float64").ravel()
+        kwalificatie = np.tile(df["kwalificatie"].to_numpy(), len(MAANDEN)).ravel()
+    n_rijen, n_dv = len(df), len(dienstverbanden)
+
+    maand = np.tile(np.repeat(np.arange(1, 13, dtype="int8"), n_dv), n_rijen)
+    dienstverband = np.tile(dienstverbanden, len(MAANDEN) * n_rijen)
+    rij = np.repeat(np.arange(n_rijen), len(MAANDEN) * n_dv)
+
+    # Maanden zonder dienstbetrekking eruit (NaN: dat dienstverband is er niet).
+    # Alleen precies 0 eruit, soms negatief = correctie op ander dienstverband?
+    behouden = ~np.isnan(fte) & (fte != 0)
+    rij = rij[behouden]
+    maand = maand[behouden]
+    kalenderjaar = df.index.get_level_values("Kalenderjaar").to_numpy()[rij]
+
+    df_long = pd.DataFrame(
+        {
+            "Organisatie": df.index.get_level_values("Organisatie").to_numpy()[rij],
+            "Functie": df.index.get_level_values("Functie").to_numpy()[rij],
+            "persnr": df.index.get_level_values("persnr").to_numpy()[rij],
+            "Kalenderjaar": kalenderjaar,
+            "maand": maand,
+            "Dienstverband": dienstverband[behouden],
+            "Onderwijskwalificatie": pd.Categorical.from_codes(
+                kwalificatie[behouden].astype("int8"), dtype=kwalificaties
+            ),
+            "fte": fte[behouden],
+            "kwartaal": pd.Categorical.from_codes((maand - 1) // 3, dtype=KWARTALEN),
+            # Datum als kwartaalnummer, labels als "2021 Q3" alleen voor weergave
+            "Datum": datum_ordinaal(kalenderjaar, maand.astype(kalenderjaar.dtype)),
+        }
     )
 
-    df = df_long.sort_values(
-        ["Organisatie", "persnr", "Functie", "Kalenderjaar", "maand"]
+    return df_long
+
+
+def preprocess_stroom(
+    chunks, faculteiten=["FGw", "FMG", "FdR", "FNWI", "FEB"], partities=16, werkmap=None
+):
+    """preprocess voor exports die niet in hun geheel in het geheugen passen.
+
+    chunks is een iterable van stukken van de export (DataFrames met de kolommen
+    van de export), bijv. uit opslag.lees_export_chunks. Elk stuk wordt meteen
+    geaggregeerd en op persnr verdeeld over partities op schijf (in werkmap,
+    standaard een tijdelijke directory). Daarna wordt elke partitie samengevoegd
+    en naar maanden omgezet. Alle groupbys hebben persnr in de sleutel, dus een
+    partitie is compleet. Alleen het (compacte) eindresultaat staat in zijn geheel
+    in het geheugen. Geeft hetzelfde als preprocess op de hele export.
+    """
+    with tempfile.TemporaryDirectory(dir=werkmap) as map:
+        bestanden = [[] for _ in range(partities)]
+        for i, chunk in enumerate(chunks):
+            deel = _aggregeer_export(chunk, faculteiten)
+            persnr = deel.index.get_level_values("persnr").to_numpy()
+            partitie = pd.util.hash_array(persnr) % partities
+            for p in np.unique(partitie):
+                pad = os.path.join(map, f"{p}_{i}.pkl")
+                deel[partitie == p].to_pickle(pad)
+                bestanden[p].append(pad)
+            del chunk, deel
+
+        delen = [
+            compact(_naar_maanden(_combineer([pd.read_pickle(pad) for pad in paden])))
+            for paden in bestanden
+            if paden
+        ]
+
+    return samenvoegen(delen)
+
+
+def preprocess_parallel(
+    df, faculteiten=["FGw", "FMG", "FdR", "FNWI", "FEB"], processen=None
+):
+    """preprocess verdeeld over een pool van processen, een Organisatie per taak.
+
+    Alle groupbys van preprocess hebben Organisatie in de sleutel, dus na het
+    hernoemen (FdR zonder PPLE, zie _organisaties) is elke Organisatie apart te
+    verwerken. De processen krijgen de export bij het starten mee (bij fork
+    zonder kopie), een taak is alleen de regels van een Organisatie. De
+    resultaten gaan op volgorde van Organisatie aan elkaar, dan staan ze al in
+    de SORTERING van preprocess. Geeft hetzelfde als preprocess.
+    """
+    organisatie = _organisaties(df["Organisatie"], faculteiten).to_numpy()
+    organisatie = np.where(pd.Series(organisatie).isin(faculteiten), organisatie, None)
+    regels = pd.Series(organisatie).groupby(organisatie).indices
+    if not regels:
+        # Niets over na het filteren: geen processen nodig, en geen delen om
+        # samen te voegen
+        return preprocess(df, faculteiten)
+
+    with ProcessPoolExecutor(
+        processen, initializer=_start_proces, initargs=(df, faculteiten)
+    ) as pool:
+        # De grootste eerst, dan wachten de processen aan het eind niet op een
+        # grote Organisatie die als laatste begon
+        taken = {
+            naam: pool.submit(_preprocess_deel, regels[naam])
+            for naam in sorted(regels, key=lambda naam: -len(regels[naam]))
+        }
+        # Op alfabet, de volgorde van de categorieen na compact
+        delen = [taken[naam].result() for naam in sorted(taken)]
+
+    return pd.concat(_zelfde_categorieen(delen), ignore_index=True)
+
+
+# De export en faculteiten in een proces van preprocess_parallel
+_proces = {}
+
+
+def _start_proces(df, faculteiten):
+    _proces.update(df=df, faculteiten=faculteiten)
+
+
+def _preprocess_deel(regels):
+    return preprocess(_proces["df"].iloc[regels], _proces["faculteiten"])
+
+
+def _zelfde_categorieen(delen):
+    """Geef alle delen dezelfde categorieen, dan blijven de kolommen categorisch
+    bij het samenvoegen."""
+    dtypes = {}
+    for kolom in CATEGORISCH:
+        if kolom not in delen[0].columns:
+            continue
+        categorieen = pd.Series(
+            np.concatenate([deel[kolom].cat.categories for deel in delen])
+        )
+        if kolom == "Onderwijskwalificatie":
+            dtypes[kolom] = kwalificatie_type(categorieen)
+        else:
+            dtypes[kolom] = pd.CategoricalDtype(sorted(set(categorieen)), ordered=True)
+    return [deel.astype(dtypes) for deel in delen]
+
+
+def samenvoegen(delen, sleutel=SORTERING):
+    """Voeg stukken met dezelfde kolommen (bijv. maanddata uit compact) samen,
+    gesorteerd op sleutel."""
+    return sorteer(pd.concat(_zelfde_categorieen(delen), ignore_index=True), sleutel)
+
+
+def sorteer(df, sleutel=SORTERING):
+    """Maanddata in de SORTERING. Na hash_nr opnieuw nodig: preprocess sorteert op
+    het echte persnr, voeg_maanden_toe op het gehashte. Zo geeft dezelfde data
+    dezelfde rijen (en versie), of hij in 1 keer gemaakt is of met toevoegen."""
+    return df.sort_values(sleutel, kind="stable", ignore_index=True)
+
+
+def na_maand(df_raw, jaar, maand):
+    """Alleen het deel van een export na (jaar, maand), voor preprocess bij het
+    toevoegen van nieuwe maanden. Eerdere jaren gaan eruit, eerdere maanden van
+    hetzelfde jaar worden leeg gemaakt. Die regels blijven wel staan, zodat de
+    Onderwijskwalificatie per persoon per jaar hetzelfde is als bij de hele export.
+    """
+    df_raw = df_raw[df_raw["Kalenderjaar"] >= jaar].copy()
+    df_raw.loc[df_raw["Kalenderjaar"] == jaar, MAANDEN[:maand]] = np.nan
+    return df_raw
+
+
+def voeg_maanden_toe(df, nieuw, jaar, maand):
+    """Vervang alle maanden na (jaar, maand) in df door die uit nieuw.
+
+    df en nieuw zijn maanddata (output van compact, persnr al gehasht).
+    Het resultaat is gesorteerd op het gehashte persnr, zie sorteer.
+    Geeft (samengevoegde maanddata, kwartalen waarin iets veranderd kan zijn),
+    dat laatste voor werk_kubus_bij.
+    """
+    tm = jaar * 12 + maand
+
+    def na(x):
+        return (x["Kalenderjaar"].astype("int32") * 12 + x["maand"] > tm).to_numpy()
+
+    weg = na(df)
+    nieuw = nieuw[na(nieuw)]
+    datums = np.union1d(df["Datum"][weg], nieuw["Datum"])
+    return samenvoegen([df[~weg], nieuw]), datums
+
+
+def kwalificatie_type(kwalificaties):
+    """Geordende categorie voor Onderwijskwalificatie: "Geen" is het laagst,
+    daarna alfabetisch, zoals de hoogste kwalificatie altijd bepaald is.
+    """
+    overig = sorted(set(kwalificaties.dropna()) - {"Geen"})
+    return pd.CategoricalDtype(["Geen"] + overig, ordered=True)
+
+
+def datum_ordinaal(jaar, maand=1):
+    """Kwartaalnummer van (jaar, maand): jaar * 4 + kwartaal - 1.
+    Werkt op getallen en op hele kolommen tegelijk.
+    """
+    return jaar * 4 + (maand - 1) // 3
+
+
+def datum_labels(datums):
+    """Kwartaalnummers naar labels als "2021 Q3", alleen voor weergave.
+    Labels (bijv. uit een oude CSV) blijven zoals ze zijn.
+    """
+    datums = np.asarray(datums)
+    if not np.issubdtype(datums.dtype, np.integer):
+        return datums
+    jaar, kwartaal = np.divmod(datums, 4)
+    return np.char.add(np.char.add(jaar.astype(str), " Q"), (kwartaal + 1).astype(str))
+
+
+def compact(df):
+    """Zet de maanddata om naar de compacte representatie waar het dashboard mee werkt:
+    categorieen voor de tekstkolommen, kwartaalnummers voor Datum,
+    float32 voor fte en int64 voor persnr.
+    Ook voor oudere data met Datum als "2021 Q3" (zoals een CSV export).
+    """
+    df = df.astype(
+        {"persnr": "int64", "Kalenderjaar": "int16", "maand": "int8", "fte": "float32"}
     )
+    for kolom in CATEGORISCH:
+        if kolom == "kwartaal":
+            df[kolom] = df[kolom].astype(KWARTALEN)
+        elif kolom == "Onderwijskwalificatie":
+            df[kolom] = df[kolom].astype(kwalificatie_type(df[kolom]))
+        else:
+            df[kolom] = df[kolom].astype("category").cat.as_ordered()
+    if not np.issubdtype(df["Datum"].dtype, np.integer):
+        df["Datum"] = datum_ordinaal(
+            df["Kalenderjaar"].astype("int32"), df["maand"].astype("int32")
+        )
+    df["Datum"] = df["Datum"].astype("int32")
 
     return df
 
 
-def perc_vast_FTE(df, functie="Docent 4", plot=True, mindate="2021 Q1"):
-    """Prepare data for a specific plot:
-    Percentage "vast" of "functie", over time in 2021-22
-    Based on FTEs
-    Set plot=False als je alleen data wilt, geen plot.
-    mindate is de minimale datum in de resultaten en plot
+def selecteer(df, functies=None, organisaties=None, jaren=None):
+    """Alleen de rijen van de maanddata die een analyse nodig heeft, voor de
+    aggregatie: functies en organisaties (lijsten, None is alles) en jaren
+    (van, tot en met; t/m None is zonder einde). Een smal tijdvak kost dan ook
+    naar verhouding minder.
     """
-
-    # tel het aantal docenten 4 per type dienstverband per kwartaal (en per jaar en per faculteit)
-    df = df[df.Functie == functie]
-    # FTEs optellen voor verschillende mensen, maar middelen over de drie maanden.
-    df_kwart_mean_person = df.groupby(
-        ["Organisatie", "Datum", "Dienstverband", "persnr"], as_index=False
-    )["fte"].mean()
-    df_kwart_sum = (
-        df_kwart_mean_person.groupby(
-            ["Organisatie", "Datum", "Dienstverband"], as_index=False
-        )["fte"]
-        .sum()
-        .reset_index()
+    masker = np.ones(len(df), dtype=bool)
+    if functies is not None:
+        masker &= df["Functie"].isin(functies).to_numpy()
+    if organisaties is not None:
+        masker &= df["Organisatie"].isin(organisaties).to_numpy()
+    if jaren is not None:
+        datum = df["Datum"].to_numpy()
+        masker &= datum >= datum_ordinaal(jaren[0], 1)
+        if jaren[1] is not None:
+            masker &= datum <= datum_ordinaal(jaren[1], 12)
+    return df[masker]
+
+
+def _jaren(jaren, mindate):
+    """jaren voor selecteer, met mindate (bijv. "2021 Q1") als verouderde alias:
+    vanaf het jaar van mindate, zonder einde. Het kwartaal telt niet mee, jaren
+    gaat per jaar. Ook een mindate als vierde argument (de oude volgorde) werkt.
+    """
+    if isinstance(jaren, str):
+        jaren, mindate = None, jaren
+    if mindate is None:
+        return jaren
+    warnings.warn(
+        "mindate is vervangen door jaren=(van, t/m)", DeprecationWarning, stacklevel=4
     )
+    if jaren is not None:
+        raise TypeError("geef jaren of mindate, niet allebei")
+    return (int(str(mindate).split()[0]), None)
 
+
+def loopbanen(df, selectie, functies=None, organisaties=None):
+    """De hele geschiedenis (in functies en organisaties, over alle jaren) van
+    iedereen in selectie. Een overgang telt in het laatste kwartaal in 'van' en
+    kan naar een toestand voor of na het tijdvak gaan; daarvoor is de rest van de
+    loopbaan nodig, maar alleen van wie in het tijdvak voorkomt.
+    """
+    loopbaan = selecteer(df, functies, organisaties)
+    return loopbaan[loopbaan["persnr"].isin(pd.unique(selectie["persnr"]))]
+
+
+def _pivot_vast(df_kwart, waarde):
+    """Zet een tabel per (Organisatie, Datum, Dienstverband) om naar
+    kolommen Tijdelijk, Vast en Totaal met fracties en percentages vast.
+    waarde is de kolom die opgeteld wordt (head count of FTE).
+    """
     ## Per organisatie, per kwartaal, per Dienstverband ...
     # tellen we nu FTEs op per dienstverband.
-    df_pivot = df_kwart_sum.pivot(
-        index=["Organisatie", "Datum"], columns="Dienstverband", values="fte"
+    df_pivot = df_kwart.pivot(
+        index=["Organisatie", "Datum"], columns="Dienstverband", values=waarde
     )
-    # Als het kwartaal niet voorkomt zijn er kennelijk 0 mensen:
-    df_pivot["Tijdelijk"].replace(np.nan, 0, inplace=True)
-    df_pivot["Vast"].replace(np.nan, 0, inplace=True)
+    # Een categorische Dienstverband geeft categorische kolommen, daar kan Totaal
+    # niet bij. Als het kwartaal niet voorkomt zijn er kennelijk 0 mensen; in een
+    # smalle selectie (een faculteit, een jaar) kan dat een hele kolom zijn.
+    df_pivot.columns = df_pivot.columns.astype(str)
+    df_pivot = df_pivot.reindex(columns=["Tijdelijk", "Vast"]).fillna(0)
     # Totaal is som vast en tijdelijk (let op caveats boven)
     df_pivot["Totaal"] = df_pivot["Tijdelijk"] + df_pivot["Vast"]
 
@@ -188,14 +533,32 @@ def perc_vast_FTE(df, functie="Docent 4", plot=True, mindate="2021 Q1"):
     )
     df_sorted = df_pivot.sort_values(["Organisatie", "Datum"]).reset_index()
 
-    # Maak een zinnig datumkolom en percentages
+    # Maak percentages
     df_sorted["Percentage met Vast contract"] = df_sorted["fractie vast contract"] * 100
     df_sorted["Percentage met Tijdelijk contract"] = (
         df_sorted["fractie tijdelijk contract"] * 100
     )
 
-    # Alleen relevante tijdspanne
-    # df_sorted = df_sorted[df_sorted.Datum >= mindate]
+    return df_sorted
+
+
+@metrics.getimed(metrics.ANALYSES)
+def perc_vast_FTE(
+    df, functie="Docent 4", plot=True, jaren=None, organisaties=None, mindate=None
+):
+    """Prepare data for a specific plot:
+    Percentage "vast" of "functie", over time in 2021-22
+    Based on FTEs
+    Set plot=False als je alleen data wilt, geen plot.
+    jaren (van, t/m) en organisaties beperken de resultaten en plot, zie selecteer;
+    mindate is verouderd, zie _jaren
+    """
+    jaren = _jaren(jaren, mindate)
+
+    # FTEs optellen voor verschillende mensen, maar middelen over de drie maanden,
+    # zie kwartaal_summary
+    summary = kwartaal_summary(selecteer(df, [functie], organisaties, jaren))
+    df_sorted = perc_vast_kubus(summary, functie=functie, maat="fte")
 
     if plot:
         plot_pvast(df_sorted, functie=functie)
@@ -203,88 +566,70 @@ def perc_vast_FTE(df, functie="Docent 4", plot=True, mindate="2021 Q1"):
     return df_sorted
 
 
-def perc_vast_HC(df, functie="Docent 4", plot=True, mindate="2021 Q1"):
+@metrics.getimed(metrics.ANALYSES)
+def perc_vast_HC(
+    df, functie="Docent 4", plot=True, jaren=None, organisaties=None, mindate=None
+):
     """Prepare data for a specific plot:
     Percentage "vast" of "functie", over time in 2021-22
     Based on headcount.
     Set plot=False als je alleen de df wilt, zonder plot.
-    mindate is de minimale datum in de resultaten en plot
+    jaren (van, t/m) en organisaties beperken de resultaten en plot, zie selecteer;
+    mindate is verouderd, zie _jaren
     """
-    df = df[df.Functie == functie]
-    df_kwart_count = df.groupby(
-        ["Organisatie", "Datum", "Dienstverband"], as_index=False
-    )["persnr"].nunique()
+    jaren = _jaren(jaren, mindate)
+    summary = kwartaal_summary(selecteer(df, [functie], organisaties, jaren))
+    df_sorted = perc_vast_kubus(summary, functie=functie, maat="headcount")
 
-    ## Per organisatie, per kwartaal, per Dienstverband ...
-    # tellen we nu FTEs op per dienstverband.
-    df_pivot = df_kwart_count.pivot(
-        index=["Organisatie", "Datum"], columns="Dienstverband", values="persnr"
-    )
-    # Als het kwartaal niet voorkomt zijn er kennelijk 0 mensen:
-    df_pivot["Tijdelijk"].replace(np.nan, 0, inplace=True)
-    df_pivot["Vast"].replace(np.nan, 0, inplace=True)
-    # Totaal is som vast en tijdelijk (let op caveats boven)
-    df_pivot["Totaal"] = df_pivot["Tijdelijk"] + df_pivot["Vast"]
+    if plot:
+        plot_pvast_hc(df_sorted, functie=functie)
 
-    # Fracties tijdelijk en vast
-    df_pivot["fractie vast contract"] = df_pivot["Vast"] / (df_pivot["Totaal"])
-    df_pivot["fractie tijdelijk contract"] = df_pivot["Tijdelijk"] / (
-        df_pivot["Totaal"]
-    )
-    df_sorted = df_pivot.sort_values(["Organisatie", "Datum"]).reset_index()
+    return df_sorted
 
-    # Maak percentages
-    df_sorted["Percentage met Vast contract"] = df_sorted["fractie vast contract"] * 100
-    df_sorted["Percentage met Tijdelijk contract"] = (
-        df_sorted["fractie tijdelijk contract"] * 100
-    )
 
-    # df_sorted = df_sorted[df_sorted.Datum >= mindate]
+def _tijdelijk_vast(omzettingen, tot, functie):
+    """Zet de omzettingen van tijdelijk naar vast (per Organisatie en laatste kwartaal
+    tijdelijk, uit overgangen) naast het totaal aantal tijdelijken per kwartaal,
+    tot de tabel van tijdelijk_vast.
+    """
+    omzettingen = omzettingen[
+        (omzettingen.Functie == functie)
+        & (omzettingen.van == "Tijdelijk")
+        & (omzettingen.naar == "Vast")
+    ]
+    df_tv = omzettingen[["Organisatie", "Datum", "aantal"]].rename(
+        columns={"aantal": "# naar vast"}
+    )
 
-    if plot:
-        plot_pvast_hc(df_sorted, functie=functie)
+    # Voeg ook totaal aantal docenten toe ter vergelijking
+    tot = tot.rename(columns={"persnr": f"{functie}, Tijdelijk"})
+    df_tv = tot.merge(df_tv, how="left")
+    df_tv.replace(np.nan, 0, inplace=True)
 
-    return df_sorted
+    return df_tv
 
 
-def tijdelijk_vast(df, functie="Docent 4", plot=True):
+@metrics.getimed(metrics.ANALYSES)
+def tijdelijk_vast(df, functie="Docent 4", plot=True, jaren=None, organisaties=None):
     """Prepare data for a specific plot:
     Aantal mensen in "functie" die van tijdelijk naar vast is gegaan is
     Based on headcount.
     Set plot=False als je alleen de df wilt, zonder plot.
-    mindate is de minimale datum in de resultaten en plot
+    jaren (van, t/m) en organisaties beperken de resultaten en plot, zie selecteer
     """
-    df = df[df.Functie == functie]
-
-    # Laatste tijdelijk en eerste vast
-    df_tijdelijk = (
-        df[df.Dienstverband == "Tijdelijk"]
-        .groupby(["Organisatie", "persnr"], as_index=False)
-        .Datum.max()
-    )
-    df_vast = (
-        df[df.Dienstverband == "Vast"]
-        .groupby(["Organisatie", "persnr"], as_index=False)
-        .Datum.min()
-    )
-
-    # df_tijdelijk.rename(columns={'Datum':'Laatste kwartaal tijdelijk'}, inplace=True)
-    df_vast.rename(columns={"Datum": "Eerste kwartaal vast"}, inplace=True)
+    df_tijdvak = selecteer(df, [functie], organisaties, jaren)
 
-    df_tv = pd.merge(df_tijdelijk, df_vast, how="inner")
-
-    df_tv = df_tv.groupby(["Organisatie", "Datum"], as_index=False).persnr.nunique()
-    df_tv.rename(columns={"persnr": "# naar vast"}, inplace=True)
-
-    # Voeg ook totaal aantal docenten toe ter vergelijking
+    # Laatste tijdelijk en eerste vast per persoon, in de overgangen. Die hangen
+    # af van de hele loopbaan van wie in het tijdvak voorkomt.
+    loopbaan = loopbanen(df, df_tijdvak, [functie], organisaties)
+    omzettingen = overgangen(_tijdlijn(loopbaan))["omzettingen"]
     tot = (
-        df[df.Dienstverband == "Tijdelijk"]
-        .groupby(["Organisatie", "Datum"], as_index=False)
+        df_tijdvak[df_tijdvak.Dienstverband == "Tijdelijk"]
+        .groupby(["Organisatie", "Datum"], as_index=False, observed=True)
         .persnr.nunique()
     )
-    tot.rename(columns={"persnr": f"{functie}, Tijdelijk"}, inplace=True)
-    df_tv = tot.merge(df_tv, how="left")
-    df_tv.replace(np.nan, 0, inplace=True)
+
+    df_tv = _tijdelijk_vast(omzettingen, tot, functie)
 
     if plot:
         plot_vasttijdelijk(df_tv, functie=functie)
@@ -292,37 +637,17 @@ def tijdelijk_vast(df, functie="Docent 4", plot=True):
     return df_tv
 
 
-def promotie(df, van="Docent 4", naar="Docent 3", plot=True, mindate="2020 Q1"):
-    """Script die aantallen en percentages uit de Functie='van' groep, naar de Functie='naar' groep bepaalt.
-    Van en naar geldt alleen binnen dezelfde Organisatie.
-    Set plot=False als je alleen data en geen plot wilt.
-    mindate is de minimale datum die in de resulterende data en plot voorkomt.
+def _promoties(matrix, df_tot, van, naar):
+    """Zet de overgangen van 'van' naar 'naar' (per Organisatie en laatste kwartaal
+    in 'van', uit overgangen) naast het totaal aantal 'van' per kwartaal,
+    tot de tabel van promotie.
     """
-    df_van = df[df.Functie == van]
-    df_naar = df[df.Functie == naar]
-
-    # Laatste kwartaal in 'van' en eerste in 'naar'
-    df_goodbye = df_van.groupby(["Organisatie", "persnr"], as_index=False).Datum.max()
-    df_hello = df_naar.groupby(["Organisatie", "persnr"], as_index=False).Datum.min()
-
-    df_goodbye.rename(columns={"Datum": f"Laatste kwartaal {van}"}, inplace=True)
-    df_hello.rename(columns={"Datum": f"Eerste kwartaal {naar}"}, inplace=True)
-
-    df_promotie = pd.merge(
-        df_goodbye, df_hello, how="inner", on=["Organisatie", "persnr"]
+    matrix = matrix[(matrix.van == van) & (matrix.naar == naar)]
+    df_proms = matrix[["Organisatie", "Datum", "aantal"]].rename(
+        columns={"aantal": "Omzettingen"}
     )
 
-    # Aantallen van/naar per kwartaal en aantallen promoties per kwartaal
-    df_tot = df_van.groupby(["Organisatie", "Datum"], as_index=False).persnr.nunique()
-    df_proms = df_promotie.groupby(
-        ["Organisatie", f"Laatste kwartaal {van}"], as_index=False
-    ).persnr.nunique()
-
-    df_tot.rename(columns={"persnr": f"{van}"}, inplace=True)
-    df_proms.rename(
-        columns={"persnr": "Omzettingen", f"Laatste kwartaal {van}": "Datum"},
-        inplace=True,
-    )
+    df_tot = df_tot.rename(columns={"persnr": f"{van}"})
     df_promoties = pd.merge(df_tot, df_proms, how="left", on=["Organisatie", "Datum"])
     df_promoties.replace(np.nan, 0, inplace=True)
     df_promoties["Aantal geen promotie"] = (
@@ -332,7 +657,39 @@ def promotie(df, van="Docent 4", naar="Docent 3", plot=True, mindate="2020 Q1"):
         df_promoties["Omzettingen"] / df_promoties[f"{van}"] * 100
     )
 
-    # df_promoties = df_promoties[df_promoties.Datum >= mindate]
+    return df_promoties
+
+
+@metrics.getimed(metrics.ANALYSES)
+def promotie(
+    df,
+    van="Docent 4",
+    naar="Docent 3",
+    plot=True,
+    jaren=None,
+    organisaties=None,
+    mindate=None,
+):
+    """Script die aantallen en percentages uit de Functie='van' groep, naar de Functie='naar' groep bepaalt.
+    Van en naar geldt alleen binnen dezelfde Organisatie.
+    Set plot=False als je alleen data en geen plot wilt.
+    jaren (van, t/m) en organisaties beperken de resultaten en plot, zie selecteer;
+    mindate is verouderd, zie _jaren
+    """
+    jaren = _jaren(jaren, mindate)
+    df_van = selecteer(df, [van], organisaties, jaren)
+
+    # Laatste kwartaal in 'van' en eerste in 'naar' per persoon, in de overgangen,
+    # uit de hele loopbaan (in van en naar) van wie in het tijdvak in 'van' zit
+    loopbaan = loopbanen(df, df_van, [van, naar], organisaties)
+    matrix = overgangen(_tijdlijn(loopbaan))["overgangen"]
+
+    # Aantallen van/naar per kwartaal
+    df_tot = df_van.groupby(
+        ["Organisatie", "Datum"], as_index=False, observed=True
+    ).persnr.nunique()
+
+    df_promoties = _promoties(matrix, df_tot, van, naar)
 
     if plot:
         plot_promoties(df_promoties, van=van, naar=naar)
@@ -340,12 +697,18 @@ def promotie(df, van="Docent 4", naar="Docent 3", plot=True, mindate="2020 Q1"):
     return df_promoties
 
 
-def fte_pp(df, functie="Docent 4", plot=True, mindate="2020 Q1"):
+@metrics.getimed(metrics.ANALYSES)
+def fte_pp(
+    df, functie="Docent 4", plot=True, jaren=None, organisaties=None, mindate=None
+):
     """FTE per persoon, voor functie
-    Gebruikt de FTEs en de HCs van de functies hierboven. Let op: deze worden opnieuw berekend!
+    Gebruikt de FTEs en de HCs van de functies hierboven, uit een kwartaal_summary.
+    jaren en organisaties zoals in perc_vast_HC
     """
-    headcount = perc_vast_HC(df, functie=functie, plot=False)
-    fte = perc_vast_FTE(df, functie=functie, plot=False)
+    jaren = _jaren(jaren, mindate)
+    summary = kwartaal_summary(selecteer(df, [functie], organisaties, jaren))
+    headcount = perc_vast_kubus(summary, functie=functie, maat="headcount")
+    fte = perc_vast_kubus(summary, functie=functie, maat="fte")
 
     headcount.rename(
         columns={"Vast": "vast_hc", "Tijdelijk": "tijdelijk_hc", "Totaal": "totaal_hc"},
@@ -359,23 +722,22 @@ def fte_pp(df, functie="Docent 4", plot=True, mindate="2020 Q1"):
     fte["FTE_pp_vast"] = fte.Vast / fte.vast_hc
     fte["FTE_pp_tijdelijk"] = fte.Tijdelijk / fte.tijdelijk_hc
 
-    # fte = fte[fte.Datum >= mindate]
-
     if plot:
         plot_fte_pp(fte, functie=functie)
 
     return fte
 
 
-def fte_dist(df, functie="Docent 4", plot=True, mindate="2020 Q1"):
-    """De verdeling van de FTEs per persoon, dus zonder aggregatie"""
-    fte_pp = (
-        df[df.Functie == functie]
-        .groupby(["Organisatie", "persnr", "Datum", "Dienstverband"], as_index=False)
-        .fte.mean()
-    )
-
-    # fte_pp = fte_pp[fte_pp.Datum >= mindate]
+@metrics.getimed(metrics.ANALYSES)
+def fte_dist(
+    df, functie="Docent 4", plot=True, jaren=None, organisaties=None, mindate=None
+):
+    """De verdeling van de FTEs per persoon, dus zonder aggregatie.
+    jaren en organisaties zoals in perc_vast_HC"""
+    jaren = _jaren(jaren, mindate)
+    # Alleen de FTE per persoon, de rest van kwartaal_summary is hier niet nodig
+    summary = {"fte_pp": _fte_pp(selecteer(df, [functie], organisaties, jaren))}
+    fte_pp = fte_dist_kubus(summary, functie=functie).reset_index(drop=True)
 
     if plot:
         plot_fte_dist(fte_pp, functie=functie)
@@ -383,25 +745,13 @@ def fte_dist(df, functie="Docent 4", plot=True, mindate="2020 Q1"):
     return fte_pp
 
 
-def percentages_docenten(
-    df,
-    functies=["Docent 1", "Docent 2", "Docent 3", "Docent 4"],
-    plot=True,
-    mindate="2020 Q1",
-):
-    """Percentages van Docenten 4, 3, 2, 1 over de tijd
-    voor alle faculteiten in df"""
-
-    # Gebruik voorgaande functionaliteit, ook al duurt dat wat langer
-    all_functies = pd.DataFrame()
-    for functie in functies:
-        df_functie = perc_vast_HC(df, functie=functie, plot=False, mindate=mindate)
-        df_functie["Functie"] = functie
-        all_functies = all_functies.append(df_functie)
-
-    aantallen = all_functies.groupby(["Organisatie", "Datum"], as_index=False)[
-        ["Tijdelijk", "Vast", "Totaal"]
-    ].sum()
+def _percentages_docenten(all_functies):
+    """Voeg totalen per (Organisatie, Datum) en percentages per functie toe
+    aan de head counts per functie (output van perc_vast_HC met kolom Functie).
+    """
+    aantallen = all_functies.groupby(
+        ["Organisatie", "Datum"], as_index=False, observed=True
+    )[["Tijdelijk", "Vast", "Totaal"]].sum()
     aantallen.rename(
         columns={
             "Tijdelijk": "Totaal tijdelijk",
@@ -425,12 +775,275 @@ def percentages_docenten(
         all_functies["Totaal"] / all_functies["Totaal allen"] * 100
     )
 
+    return all_functies
+
+
+@metrics.getimed(metrics.ANALYSES)
+def percentages_docenten(
+    df,
+    functies=["Docent 1", "Docent 2", "Docent 3", "Docent 4"],
+    plot=True,
+    jaren=None,
+    organisaties=None,
+    mindate=None,
+):
+    """Percentages van Docenten 4, 3, 2, 1 over de tijd
+    voor alle faculteiten in df (of alleen organisaties), binnen jaren
+    (mindate is verouderd, zie _jaren)"""
+    jaren = _jaren(jaren, mindate)
+
+    # Alle functies uit een kwartaal_summary
+    summary = kwartaal_summary(selecteer(df, functies, organisaties, jaren))
+    all_functies = percentages_docenten_kubus(summary, functies)
+
     if plot:
-        plot_percentages_docenten(all_functies, mindate=mindate, subpop=None)
+        plot_percentages_docenten(all_functies, subpop=None)
 
     return all_functies
 
 
+################################################################
+
+######## AGGREGATEN VOOR HET DASHBOARD #########################
+
+################################################################
+
+
+# Groepering van de tabellen in de kubus, zie bouw_kubus
+KUBUS_SLEUTELS = {
+    "fte_pp": ["Functie", "Organisatie", "persnr", "Datum", "Dienstverband"],
+    "kubus": ["Functie", "Organisatie", "Datum", "Dienstverband"],
+    "functie_hc": ["Functie", "Organisatie", "Datum"],
+    "tijdlijn": ["Functie", "Organisatie", "Dienstverband", "persnr"],
+    "overgangen": ["Organisatie", "van", "naar", "Datum"],
+    "omzettingen": ["Functie", "Organisatie", "van", "naar", "Datum"],
+}
+
+
+def bouw_kubus(df):
+    """Reken eenmalig alle aggregaten uit die het dashboard nodig heeft.
+
+    Geeft een dict met:
+    - "fte_pp": gemiddelde FTE per persoon per kwartaal,
+      per (Functie, Organisatie, persnr, Datum, Dienstverband)
+    - "kubus": per (Functie, Organisatie, Datum, Dienstverband) de head count,
+      de FTE som en statistieken van de FTE per persoon
+    - "functie_hc": head count per (Functie, Organisatie, Datum), ongeacht dienstverband
+    - "tijdlijn": eerste en laatste kwartaal per (Functie, Organisatie, Dienstverband, persnr)
+    - "overgangen" en "omzettingen": de overgangsmatrices, zie overgangen
+
+    De *_kubus functies hieronder geven dezelfde tabellen als de functies hierboven,
+    maar werken alleen op deze (kleine) tabellen en niet meer op de maanddata.
+    """
+    summary = kwartaal_summary(df)
+    fte_pp = summary["fte_pp"]
+
+    # Wie in een kwartaal zowel tijdelijk als vast is telt hier maar 1x
+    functie_hc = fte_pp.groupby(
+        KUBUS_SLEUTELS["functie_hc"], as_index=False, observed=True
+    ).persnr.nunique()
+
+    tijdlijn = _tijdlijn(fte_pp)
+
+    return {
+        **summary,
+        "functie_hc": functie_hc,
+        "tijdlijn": tijdlijn,
+        **overgangen(tijdlijn),
+    }
+
+
+@metrics.getimed(metrics.ANALYSES)
+def kwartaal_summary(df):
+    """Alles per kwartaal in een keer, voor alle functies in df.
+
+    Een groupby over de maanddata per (Functie, Organisatie, persnr, Datum,
+    Dienstverband) geeft de FTE per persoon (gemiddeld over de maanden van het
+    kwartaal), daaruit volgen head count, FTE som en de verdeling per persoon.
+    Geeft een dict met "fte_pp" en "kubus", zoals in bouw_kubus; perc_vast_HC,
+    perc_vast_FTE, fte_pp en percentages_docenten zijn views hierop, fte_dist
+    heeft alleen fte_pp nodig (_fte_pp).
+    """
+    fte_pp = _fte_pp(df)
+
+    # fte_pp heeft een rij per persoon, dus de head count is het aantal rijen en
+    # alles volgt uit een aggregatie van de kolom fte
+    kubus = (
+        fte_pp.groupby(KUBUS_SLEUTELS["kubus"], observed=True)
+        .fte.agg(["size", "sum", "mean", "min", "median", "max"])
+        .set_axis(
+            [
+                "headcount",
+                "fte",
+                "fte_pp_gemiddeld",
+                "fte_pp_min",
+                "fte_pp_mediaan",
+                "fte_pp_max",
+            ],
+            axis=1,
+        )
+        .reset_index()
+        # reset_index maakt van de int32 Datum een int64
+        .astype({"Datum": fte_pp["Datum"].dtype})
+    )
+
+    return {"fte_pp": fte_pp, "kubus": kubus}
+
+
+def _fte_pp(df):
+    """FTE per persoon per kwartaal (gemiddeld over de maanden), per
+    (Functie, Organisatie, persnr, Datum, Dienstverband)."""
+    return df.groupby(
+        KUBUS_SLEUTELS["fte_pp"], as_index=False, observed=True
+    ).fte.mean()
+
+
+def _tijdlijn(df):
+    """Eerste en laatste kwartaal per (Functie, Organisatie, Dienstverband, persnr),
+    uit de maanddata of uit fte_pp."""
+    return df.groupby(KUBUS_SLEUTELS["tijdlijn"], as_index=False, observed=True).agg(
+        eerste=("Datum", "min"), laatste=("Datum", "max")
+    )
+
+
+def overgangen(tijdlijn):
+    """Alle overgangen in een keer, uit de tijdlijn van iedere persoon.
+
+    Geeft twee matrices met in "aantal" het aantal personen per Organisatie,
+    van, naar en kwartaal (Datum is het laatste kwartaal in 'van'):
+    - "overgangen": van Functie naar Functie (over beide dienstverbanden)
+    - "omzettingen": binnen een Functie, van Dienstverband naar Dienstverband
+    Zoals in promotie en tijdelijk_vast telt iedereen die in beide voorkomt,
+    dus ook terug (Docent 3 naar Docent 4, Vast naar Tijdelijk) en van == naar.
+    promotie en tijdelijk_vast zijn hier alleen nog een selectie uit.
+    """
+    functies = tijdlijn.groupby(
+        ["Functie", "Organisatie", "persnr"], as_index=False, observed=True
+    ).agg(eerste=("eerste", "min"), laatste=("laatste", "max"))
+
+    return {
+        "overgangen": _overgangen(functies, ["Organisatie"], "Functie"),
+        "omzettingen": _overgangen(
+            tijdlijn, ["Functie", "Organisatie"], "Dienstverband"
+        ),
+    }
+
+
+def _overgangen(toestanden, groep, toestand):
+    """Alle paren van toestanden van dezelfde persoon binnen groep, geteld per
+    groep, van, naar en laatste kwartaal in van."""
+    paren = toestanden.merge(
+        toestanden, on=groep + ["persnr"], suffixes=("_van", "_naar")
+    )
+    return (
+        paren.groupby(
+            groep + [f"{toestand}_van", f"{toestand}_naar", "laatste_van"],
+            as_index=False,
+            observed=True,
+        )
+        .size()
+        .rename(
+            columns={
+                f"{toestand}_van": "van",
+                f"{toestand}_naar": "naar",
+                "laatste_van": "Datum",
+                "size": "aantal",
+            }
+        )
+    )
+
+
+def werk_kubus_bij(kubus, df, datums):
+    """Werk de kubus bij voor de kwartalen datums, na voeg_maanden_toe.
+
+    df is de volledige (bijgewerkte) maanddata, maar alleen de kwartalen in datums
+    worden opnieuw uitgerekend. De tijdlijn alleen voor wie in die kwartalen
+    voorkomt (of voorkwam). Geeft hetzelfde als bouw_kubus(df).
+    """
+    nieuw = bouw_kubus(df[np.isin(df["Datum"], datums)])
+
+    bijgewerkt = {}
+    for naam in ["fte_pp", "kubus", "functie_hc"]:
+        oud = kubus[naam]
+        bijgewerkt[naam] = samenvoegen(
+            [oud[~np.isin(oud["Datum"], datums)], nieuw[naam]],
+            sleutel=KUBUS_SLEUTELS[naam],
+        )
+
+    fte_pp = kubus["fte_pp"]
+    personen = np.union1d(
+        fte_pp["persnr"][np.isin(fte_pp["Datum"], datums)], nieuw["fte_pp"]["persnr"]
+    )
+    fte_pp = bijgewerkt["fte_pp"]
+    tijdlijn = kubus["tijdlijn"]
+    bijgewerkt["tijdlijn"] = samenvoegen(
+        [
+            tijdlijn[~np.isin(tijdlijn["persnr"], personen)],
+            _tijdlijn(fte_pp[np.isin(fte_pp["persnr"], personen)]),
+        ],
+        sleutel=KUBUS_SLEUTELS["tijdlijn"],
+    )
+    # De matrices zijn klein genoeg om uit de hele tijdlijn opnieuw te maken
+    bijgewerkt.update(overgangen(bijgewerkt["tijdlijn"]))
+
+    return bijgewerkt
+
+
+@metrics.getimed(metrics.ANALYSES)
+def perc_vast_kubus(kubus, functie="Docent 4", maat="headcount"):
+    """Zelfde tabel als perc_vast_HC (maat="headcount") of perc_vast_FTE (maat="fte")."""
+    df_kwart = kubus["kubus"][kubus["kubus"].Functie == functie]
+    return _pivot_vast(df_kwart, maat)
+
+
+@metrics.getimed(metrics.ANALYSES)
+def tijdelijk_vast_kubus(kubus, functie="Docent 4"):
+    """Zelfde tabel als tijdelijk_vast."""
+    df_kwart = kubus["kubus"]
+    tot = df_kwart.loc[
+        (df_kwart.Functie == functie) & (df_kwart.Dienstverband == "Tijdelijk"),
+        ["Organisatie", "Datum", "headcount"],
+    ].rename(columns={"headcount": "persnr"})
+
+    return _tijdelijk_vast(kubus["omzettingen"], tot, functie)
+
+
+@metrics.getimed(metrics.ANALYSES)
+def promotie_kubus(kubus, van="Docent 4", naar="Docent 3"):
+    """Zelfde tabel als promotie."""
+    functie_hc = kubus["functie_hc"]
+    df_tot = functie_hc.loc[
+        functie_hc.Functie == van, ["Organisatie", "Datum", "persnr"]
+    ]
+
+    return _promoties(kubus["overgangen"], df_tot, van, naar)
+
+
+@metrics.getimed(metrics.ANALYSES)
+def fte_dist_kubus(kubus, functie="Docent 4"):
+    """Zelfde tabel als fte_dist."""
+    fte_pp = kubus["fte_pp"]
+    return fte_pp.loc[
+        fte_pp.Functie == functie,
+        ["Organisatie", "persnr", "Datum", "Dienstverband", "fte"],
+    ]
+
+
+@metrics.getimed(metrics.ANALYSES)
+def percentages_docenten_kubus(
+    kubus, functies=["Docent 1", "Docent 2", "Docent 3", "Docent 4"]
+):
+    """Zelfde tabel als percentages_docenten."""
+    all_functies = pd.concat(
+        [
+            perc_vast_kubus(kubus, functie=functie).assign(Functie=functie)
+            for functie in functies
+        ]
+    )
+
+    return _percentages_docenten(all_functies)
+
+
 ################################################################
 
 ######## CODE FOR PLOTS ########################################
@@ -438,14 +1051,32 @@ def percentages_docenten(
 ################################################################
 
 
+def _voor_plot(df):
+    """Maak een (kleine) tabel klaar voor een plot: kwartaalnummers worden labels,
+    categorische kolommen gewone tekst (daar groepeert plotly express niet goed op)
+    en float32 wordt float64, afgerond zodat de JSON voor de browser kort blijft.
+    """
+    df = df.copy()
+    df["Datum"] = datum_labels(df["Datum"])
+    for kolom in df.columns:
+        if isinstance(df[kolom].dtype, pd.CategoricalDtype):
+            df[kolom] = df[kolom].astype(str)
+        elif df[kolom].dtype == np.float32:
+            df[kolom] = df[kolom].astype("float64").round(6)
+    return df
+
+
+@metrics.getimed(metrics.PLOTS)
 def plot_pvast(df, functie="Docent 4"):
+    datums = datum_labels(np.unique(df["Datum"]))
+    df = _voor_plot(df)
     fig = px.line(df, x="Datum", y="Percentage met Vast contract", color="Organisatie")
     fig.update_layout(title=f"Percentage {functie} met vast contract op basis van FTE")
     fig.update_layout(
         xaxis=dict(
             type="category",
             categoryorder="array",
-            categoryarray=np.sort(np.unique(df["Datum"])),
+            categoryarray=datums,
             title="Datum",
         ),
         # autosize=True,
@@ -456,7 +1087,10 @@ def plot_pvast(df, functie="Docent 4"):
     return fig
 
 
+@metrics.getimed(metrics.PLOTS)
 def plot_pvast_hc(df, functie="Docent 4"):
+    datums = datum_labels(np.unique(df["Datum"]))
+    df = _voor_plot(df)
     fig = px.line(df, x="Datum", y="Percentage met Vast contract", color="Organisatie")
     fig.update_layout(
         title=f"Percentage {functie} met vast contract op basis van head count"
@@ -465,7 +1099,7 @@ def plot_pvast_hc(df, functie="Docent 4"):
         xaxis=dict(
             type="category",
             categoryorder="array",
-            categoryarray=np.sort(np.unique(df["Datum"])),
+            categoryarray=datums,
             title="Datum",
         ),
         # autosize=True,
@@ -476,7 +1110,10 @@ def plot_pvast_hc(df, functie="Docent 4"):
     return fig
 
 
+@metrics.getimed(metrics.PLOTS)
 def plot_vasttijdelijk(df, functie="Docent 4"):
+    datums = datum_labels(np.unique(df["Datum"]))
+    df = _voor_plot(df)
     fig = px.bar(
         df,
         x="Datum",
@@ -497,7 +1134,7 @@ def plot_vasttijdelijk(df, functie="Docent 4"):
         xaxis=dict(
             type="category",
             categoryorder="array",
-            categoryarray=np.sort(np.unique(df["Datum"])),
+            categoryarray=datums,
         ),
         # autosize=True,
     )
@@ -507,6 +1144,7 @@ def plot_vasttijdelijk(df, functie="Docent 4"):
     return fig
 
 
+@metrics.getimed(metrics.PLOTS)
 def plot_4vs3(df4, df3):
     # Prep data frames and combine
     df4 = df4.rename(columns={"Totaal": "Aantal Docenten 4"})[
@@ -516,6 +1154,8 @@ def plot_4vs3(df4, df3):
         ["Organisatie", "Datum", "Aantal Docenten 3"]
     ]
     df = pd.merge(df4, df3)
+    datums = datum_labels(np.unique(df["Datum"]))
+    df = _voor_plot(df)
 
     fig = px.bar(
         df,
@@ -529,7 +1169,7 @@ def plot_4vs3(df4, df3):
         xaxis=dict(
             type="category",
             categoryorder="array",
-            categoryarray=np.sort(np.unique(df["Datum"])),
+            categoryarray=datums,
         ),
         # autosize=True,
     )
@@ -538,7 +1178,10 @@ def plot_4vs3(df4, df3):
     return fig
 
 
+@metrics.getimed(metrics.PLOTS)
 def plot_promoties(df, van="Docent 4", naar="Docent 3"):
+    datums = datum_labels(np.unique(df["Datum"]))
+    df = _voor_plot(df)
     fig = px.bar(
         df,
         x="Datum",
@@ -553,7 +1196,7 @@ def plot_promoties(df, van="Docent 4", naar="Docent 3"):
         xaxis=dict(
             type="category",
             categoryorder="array",
-            categoryarray=np.sort(np.unique(df["Datum"])),
+            categoryarray=datums,
         ),
         # autosize=True,
     )
@@ -563,7 +1206,10 @@ def plot_promoties(df, van="Docent 4", naar="Docent 3"):
     return fig
 
 
+@metrics.getimed(metrics.PLOTS)
 def plot_fte_pp(df_sorted, functie="Docent 4"):
+    datums = datum_labels(np.unique(df_sorted["Datum"]))
+    df_sorted = _voor_plot(df_sorted)
     fig = px.line(df_sorted, x="Datum", y="FTE_pp_vast", color="Organisatie")
     # fig.update_layout(yaxis_range=[0,100], title='percentage vast contractentage docenten 4 met vast contract')
     fig.update_layout(title=f"Aantal FTE per persoon, {functie} met vast contract")
@@ -571,7 +1217,7 @@ def plot_fte_pp(df_sorted, functie="Docent 4"):
         xaxis=dict(
             type="category",
             categoryorder="array",
-            categoryarray=np.sort(np.unique(df_sorted["Datum"])),
+            categoryarray=datums,
             title="Datum",
         ),
         yaxis=dict(title="FTE per persoon, vast contract"),
@@ -586,7 +1232,7 @@ def plot_fte_pp(df_sorted, functie="Docent 4"):
         xaxis=dict(
             type="category",
             categoryorder="array",
-            categoryarray=np.sort(np.unique(df_sorted["Datum"])),
+            categoryarray=datums,
             title="Datum",
         ),
         yaxis=dict(title="FTE per persoon, tijdelijk contract"),
@@ -596,21 +1242,88 @@ def plot_fte_pp(df_sorted, functie="Docent 4"):
     return fig
 
 
+def _box_statistieken(df, groep, waarde):
+    """Per groep de statistieken van een boxplot, precies zoals plotly.js ze zelf
+    uit alle waarden uitrekent: kwartielen met de "linear" methode van plotly
+    (interpolatie op positie p * n - 0.5), whiskers tot de laatste waarde binnen
+    1.5 IQR en de waarden daarbuiten als uitschieters.
+    De groepen staan in de volgorde waarin ze in df voor het eerst voorkomen,
+    zoals plotly express de traces en categorieen ordent.
+    """
+    codes = df.groupby(groep, sort=False, observed=True).ngroup().to_numpy()
+    volgorde = np.lexsort((df[waarde].to_numpy(), codes))
+    codes, w = codes[volgorde], df[waarde].to_numpy()[volgorde]
+    n = np.bincount(codes)
+    begin = np.concatenate([[0], np.cumsum(n)[:-1]])
+
+    def kwantiel(p):
+        positie = np.clip(p * n - 0.5, 0, n - 1)
+        onder = np.floor(positie).astype("int64")
+        r = positie - onder
+        return (
+            r * w[begin + np.ceil(positie).astype("int64")] + (1 - r) * w[begin + onder]
+        )
+
+    stats = df.iloc[volgorde[begin]][groep].reset_index(drop=True)
+    stats["q1"], stats["median"], stats["q3"] = (
+        kwantiel(0.25),
+        kwantiel(0.5),
+        kwantiel(0.75),
+    )
+    iqr = (stats["q3"] - stats["q1"]).to_numpy()
+    # Whiskers: de kleinste (grootste) waarde binnen 1.5 IQR van het kwartiel
+    binnen = pd.Series(w).where(w >= (stats["q1"].to_numpy() - 1.5 * iqr)[codes])
+    stats["lowerfence"] = np.fmin(stats["q1"], binnen.groupby(codes).min())
+    binnen = pd.Series(w).where(w <= (stats["q3"].to_numpy() + 1.5 * iqr)[codes])
+    stats["upperfence"] = np.fmax(stats["q3"], binnen.groupby(codes).max())
+    buiten = (w < stats["lowerfence"].to_numpy()[codes]) | (
+        w > stats["upperfence"].to_numpy()[codes]
+    )
+    uitschieters = pd.Series(w[buiten]).groupby(codes[buiten]).agg(list)
+    stats["uitschieters"] = uitschieters.reindex(stats.index)
+    stats["uitschieters"] = [
+        x if isinstance(x, list) else [] for x in stats["uitschieters"]
+    ]
+
+    return stats
+
+
+@metrics.getimed(metrics.PLOTS)
 def plot_fte_dist(df_sorted, functie="Docent 4"):
+    datums = datum_labels(np.unique(df_sorted["Datum"]))
+    df_sorted = _voor_plot(df_sorted)
+    # Niet alle FTEs naar de browser: per box alleen de statistieken en de
+    # uitschieters. plotly express maakt de traces (kleuren, facetten, legenda),
+    # met een regel per box, daarna krijgt elke box zijn statistieken.
+    stats = _box_statistieken(
+        df_sorted, ["Organisatie", "Datum", "Dienstverband"], "fte"
+    )
     fig = px.box(
-        df_sorted,
+        stats.assign(fte=stats["median"], box=stats.index),
         x="Organisatie",
         y="fte",
         color="Datum",
         facet_col="Dienstverband",
+        custom_data=["box"],
         labels={"Dienstverband=": "Dienstverband: ", "Organisatie": "", "Datum": ""},
     )
+    for trace in fig.data:
+        box = stats.loc[trace.customdata[:, 0].astype("int64")]
+        trace.update(
+            y=box["uitschieters"].tolist(),
+            q1=box["q1"].tolist(),
+            median=box["median"].tolist(),
+            q3=box["q3"].tolist(),
+            lowerfence=box["lowerfence"].tolist(),
+            upperfence=box["upperfence"].tolist(),
+            customdata=None,
+        )
     fig.update_layout(title=f"Omvang FTE per persoon, {functie}")
     fig.update_layout(
         xaxis=dict(
             type="category",
             categoryorder="array",
-            categoryarray=np.sort(np.unique(df_sorted["Datum"])),
+            categoryarray=datums,
             title=None,
         ),
         yaxis=dict(title="Omvang FTE per persoon"),
@@ -620,7 +1333,10 @@ def plot_fte_dist(df_sorted, functie="Docent 4"):
     return fig
 
 
+@metrics.getimed(metrics.PLOTS)
 def plot_percentages_docenten(df, subpop=None):
+    datums = datum_labels(np.unique(df["Datum"]))
+    df = _voor_plot(df)
     if subpop:
         if subpop == "Vast":
             yprop = "Percentage vast"
@@ -651,7 +1367,7 @@ def plot_percentages_docenten(df, subpop=None):
         xaxis=dict(
             type="category",
             categoryorder="array",
-            categoryarray=np.sort(np.unique(df["Datum"])),
+            categoryarray=datums,
         ),
         yaxis=dict(title="Percentage"),
         # autosize=True,
@@ -0,0 +1,83 @@
+"""Gunicorn configuratie voor het dashboard.
+
+Met preload_app laadt de master de app eenmaal: de (gememory-mapte) dataset, de
+kubus en wat daaruit berekend wordt. De workers worden daarna geforkt en delen
+die pagina's alleen-lezen met de master, in plaats van elk een eigen kopie te
+bouwen. gc.freeze() zorgt dat de garbage collector van een worker de gedeelde
+objecten niet aanraakt (en daarmee kopieert).
+
+Het dashboard leest de data pas in bij de eerste callback of met warmup(); met
+DOCENTEN_WARMUP (standaard aan) gebeurt dat hier al: in de master bij preload,
+zodat de workers alles delen, en anders in elke worker voor hij requests krijgt.
+Elke worker kijkt daarna zelf of er nieuwe data is (DOCENTEN_HERLAAD).
+
+Bij het starten van elke worker wordt de opstarttijd en het geheugen gelogd:
+RSS, en van die RSS het deel dat met andere processen gedeeld wordt.
+
+Gebruik: gunicorn -c gunicorn.conf.py dashboard_docentenbeleid:server
+Het aantal workers komt uit WEB_CONCURRENCY (of --workers).
+"""
+
+import gc
+import sys
+import time
+
+import instellingen
+
+preload_app = instellingen.PRELOAD
+
+
+def geheugen():
+    """RSS en het gedeelde deel daarvan (in MB) van dit proces, uit /proc."""
+    waarden = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for regel in f:
+                delen = regel.split()
+                if len(delen) == 3 and delen[2] == "kB":
+                    waarden[delen[0].rstrip(":")] = int(delen[1]) / 1024
+    except OSError:
+        return None, None
+    gedeeld = waarden.get("Shared_Clean", 0) + waarden.get("Shared_Dirty", 0)
+    return waarden.get("Rss"), gedeeld
+
+
+def warmup():
+    sys.modules["dashboard_docentenbeleid"].warmup()
+
+
+def bewaak():
+    sys.modules["dashboard_docentenbeleid"].bewaak()
+
+
+def when_ready(server):
+    # De app is (bij preload_app) geladen, de workers zijn nog niet geforkt
+    if preload_app and instellingen.WARMUP:
+        warmup()
+    gc.freeze()
+    rss, _ = geheugen()
+    if rss is not None:
+        server.log.info("Master klaar, RSS %.0f MB (preload_app=%s)", rss, preload_app)
+
+
+def pre_fork(server, worker):
+    worker.gestart = time.perf_counter()
+
+
+def post_worker_init(worker):
+    if not preload_app and instellingen.WARMUP:
+        warmup()
+    # Threads gaan niet mee met de fork, dus per worker
+    bewaak()
+    duur = time.perf_counter() - worker.gestart
+    rss, gedeeld = geheugen()
+    if rss is None:
+        worker.log.info("Worker %s gestart in %.2f s", worker.pid, duur)
+    else:
+        worker.log.info(
+            "Worker %s gestart in %.2f s, RSS %.0f MB waarvan %.0f MB gedeeld",
+            worker.pid,
+            duur,
+            rss,
+            gedeeld,
+        )
@@ -0,0 +1,49 @@
+"""Instellingen van het dashboard.
+
+Alles heeft een standaardwaarde en is te overschrijven met een omgevingsvariabele,
+zodat er op de server niets aan de code veranderd hoeft te worden.
+"""
+
+import os
+
+# De (gehashte) dataset die het dashboard inleest: een directory in het
+# kolomformaat van opslag.py, of een CSV export
+DATAPAD = os.environ.get("DOCENTEN_DATA", "data/Docenten_2020-2022_hashed")
+
+# Sleutel waarmee prepare_public.py de persnrs hasht (docenten.hash_nr). Gebruik
+# bij elke levering dezelfde, dan blijven de gehashte persnrs gelijk.
+HASH_SLEUTEL = os.environ.get("DOCENTEN_HASH_SLEUTEL")
+
+# Maximaal aantal complete sets figuren dat in het geheugen bewaard wordt
+FIGUUR_CACHE_GROOTTE = int(os.environ.get("DOCENTEN_FIGUUR_CACHE", 128))
+
+# Over hoeveel processen prerender.py het maken van de figuren verdeelt. Het
+# maken van een figuur (plotly) houdt de GIL vast, dus processen, geen threads.
+PRERENDER_PROCESSEN = int(
+    os.environ.get("DOCENTEN_PRERENDER_PROCESSEN", os.cpu_count() or 1)
+)
+
+# Laad de app eenmaal in de gunicorn master en deel hem met de workers,
+# zie gunicorn.conf.py. Zet op 0 om elke worker zelf te laten laden.
+PRELOAD = os.environ.get("DOCENTEN_PRELOAD", "1") != "0"
+
+# Lees de data in voordat de eerste gebruiker komt (in de master bij preload,
+# anders in elke worker). Met 0 gebeurt dat pas bij de eerste callback, dan
+# starten workers het snelst.
+WARMUP = os.environ.get("DOCENTEN_WARMUP", "1") != "0"
+
+# Om de hoeveel seconden het dashboard kijkt of er een nieuwe versie van de data
+# is (alleen het kolomformaat); die wordt dan zonder herstart ingelezen, zie
+# herlaad() in het dashboard. Met 0 niet.
+HERLAAD = int(os.environ.get("DOCENTEN_HERLAAD", 60))
+
+# Profileren van callbacks, zie profiel.py. Met DOCENTEN_PROFIEL=1 wordt elke
+# callback geprofileerd; anders alleen als de pagina geopend is met een
+# ondertekende ?profiel=... (te maken met python profiel.py token), en dan
+# alleen als er een sleutel is.
+PROFIEL = os.environ.get("DOCENTEN_PROFIEL", "0") == "1"
+PROFIEL_SLEUTEL = os.environ.get("DOCENTEN_PROFIEL_SLEUTEL")
+# Hoe lang (in seconden) een ondertekende ?profiel=... geldig is
+PROFIEL_GELDIG = int(os.environ.get("DOCENTEN_PROFIEL_GELDIG", 3600))
+# Waar de profielen (pstats en de invoer als JSON) bewaard worden
+PROFIEL_MAP = os.environ.get("DOCENTEN_PROFIEL_MAP", "profielen")
@@ -0,0 +1,198 @@
+"""Metingen van het dashboard, in het tekstformaat van Prometheus op /metrics.
+
+Histogrammen (de duur van elke callback, analyse en plot, de grootte van de
+antwoorden) worden bij elke meting alleen opgeteld in een paar buckets; tellers
+die al ergens anders bijgehouden worden (zoals de hits en misses van de caches)
+worden pas gelezen als /metrics opgevraagd wordt. Zonder scrape kost het dus
+vrijwel niets.
+
+Elke gunicorn worker houdt zijn eigen metingen bij, met de pid als label.
+
+    import metrics
+
+    @metrics.getimed(metrics.ANALYSES)
+    def perc_vast_HC(df, ...): ...
+
+    metrics.koppel(app.server)
+"""
+
+import bisect
+import functools
+import os
+import threading
+import time
+
+# Grenzen van de buckets, in seconden en in bytes
+TIJD_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (1e3, 1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7)
+
+# Alle metrieken, in de volgorde waarin ze op /metrics komen
+_metrieken = []
+
+
+def _labels(namen, waarden, extra=()):
+    paren = list(zip(namen, waarden)) + list(extra) + [("pid", os.getpid())]
+    return ",".join(f'{naam}="{waarde}"' for naam, waarde in paren)
+
+
+class Histogram:
+    """Verdeling van waarden (duur, grootte) per combinatie van labels."""
+
+    soort = "histogram"
+
+    def __init__(self, naam, uitleg, labels=(), buckets=TIJD_BUCKETS):
+        self.naam = naam
+        self.uitleg = uitleg
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # Per labelwaarden: [aantal per bucket (en +Inf), som]
+        self._waarden = {}
+        self._lock = threading.Lock()
+        _metrieken.append(self)
+
+    def observeer(self, waarde, *labels):
+        i = bisect.bisect_left(self.buckets, waarde)
+        with self._lock:
+            tellingen = self._waarden.get(labels)
+            if tellingen is None:
+                tellingen = self._waarden[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            tellingen[0][i] += 1
+            tellingen[1] += waarde
+
+    def tijd(self, *labels):
+        """Context manager die de duur van het blok observeert."""
+        return _Stopwatch(self, labels)
+
+    def regels(self):
+        with self._lock:
+            waarden = {k: (list(v[0]), v[1]) for k, v in self._waarden.items()}
+        for labels, (tellingen, som) in sorted(waarden.items()):
+            cumulatief = 0
+            for grens, aantal in zip(self.buckets + ("+Inf",), tellingen):
+                cumulatief += aantal
+                le = [("le", grens if grens == "+Inf" else f"{grens:g}")]
+                bucket = _labels(self.labels, labels, le)
+                yield f"{self.naam}_bucket{{{bucket}}} {cumulatief}"
+            label = _labels(self.labels, labels)
+            yield f"{self.naam}_sum{{{label}}} {som:g}"
+            yield f"{self.naam}_count{{{label}}} {cumulatief}"
+
+
+class _Stopwatch:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *fout):
+        self.histogram.observeer(time.perf_counter() - self.start, *self.labels)
+
+
+class Waarde:
+    """Een counter of gauge. Met functie wordt de waarde pas bij de scrape
+    gelezen: functie() geeft een dict van labelwaarden (tuple) naar getal."""
+
+    def __init__(self, naam, uitleg, labels=(), soort="gauge", functie=None):
+        self.naam = naam
+        self.uitleg = uitleg
+        self.labels = tuple(labels)
+        self.soort = soort
+        self.functie = functie
+        self._waarden = {}
+        _metrieken.append(self)
+
+    def zet(self, waarde, *labels):
+        self._waarden[labels] = waarde
+
+    def regels(self):
+        waarden = self.functie() if self.functie else dict(self._waarden)
+        for labels, waarde in sorted(waarden.items()):
+            yield f"{self.naam}{{{_labels(self.labels, labels)}}} {waarde:g}"
+
+
+def getimed(histogram):
+    """Decorator: meet de duur van elke aanroep, met de functienaam als label."""
+
+    def decorator(functie):
+        naam = functie.__name__
+
+        @functools.wraps(functie)
+        def getimede_functie(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return functie(*args, **kwargs)
+            finally:
+                histogram.observeer(time.perf_counter() - start, naam)
+
+        return getimede_functie
+
+    return decorator
+
+
+def tekst():
+    """Alle metrieken in het tekstformaat van Prometheus."""
+    regels = []
+    for metriek in _metrieken:
+        regels.append(f"# HELP {metriek.naam} {metriek.uitleg}")
+        regels.append(f"# TYPE {metriek.naam} {metriek.soort}")
+        regels.extend(metriek.regels())
+    return "\n".join(regels) + "\n"
+
+
+# De metrieken van docenten.py en het dashboard
+ANALYSES = Histogram(
+    "docenten_analyse_seconden", "Duur van de analyses in docenten.py", ["functie"]
+)
+PLOTS = Histogram(
+    "docenten_plot_seconden", "Duur van de plot_* functies in docenten.py", ["functie"]
+)
+CALLBACKS = Histogram(
+    "docenten_callback_seconden", "Duur van de callbacks, per figuur", ["figuur"]
+)
+FIGUREN = Histogram(
+    "docenten_figuur_seconden",
+    "Duur van het maken van een figuur bij een cache miss, uit de voorraad van"
+    " prerender.py of live",
+    ["figuur", "bron"],
+)
+PAYLOAD = Histogram(
+    "docenten_payload_bytes",
+    "Grootte van de antwoorden op _dash-update-component (de JSON, ongecomprimeerd),"
+    " per output",
+    ["output"],
+    buckets=BYTES_BUCKETS,
+)
+LAADTIJD = Waarde(
+    "docenten_laadtijd_seconden",
+    "Tijd om de dataset, de kubus en de figuren in te lezen bij het starten",
+    ["stap"],
+)
+
+
+def koppel(server):
+    """Zet /metrics op de Flask server en meet de grootte van de antwoorden."""
+    from flask import Response, g, request
+
+    @server.after_request
+    def meet_payload(response):
+        # Een 304 heeft geen body. Geeft antwoorden.py een gecomprimeerd antwoord
+        # uit zijn cache, dan zet hij de grootte van de JSON in g.ongecomprimeerd:
+        # zo telt steeds de JSON, of het antwoord nu gecomprimeerd is of niet.
+        if (
+            request.path.endswith("/_dash-update-component")
+            and response.status_code == 200
+            and not response.direct_passthrough
+        ):
+            uitvoer = (request.get_json(silent=True) or {}).get("output", "")
+            grootte = g.get("ongecomprimeerd")
+            if grootte is None:
+                grootte = len(response.get_data())
+            PAYLOAD.observeer(grootte, uitvoer)
+        return response
+
+    @server.route("/metrics")
+    def metrics():
+        return Response(tekst(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,355 @@
+"""Opslag van de (gehashte) docentendata.
+
+De dataset wordt kolomsgewijs bewaard: per kolom een .npy bestand en een
+metadata.json met de categorieen, dtypes en wat kerngegevens (jaren, functies,
+organisaties, t/m welke maand de data loopt). Tekstkolommen staan als integer codes op schijf, zodat alles met
+np.load(mmap_mode="r") ingelezen kan worden zonder te parsen of te kopieren.
+
+De aggregaten van docenten.bouw_kubus kunnen in hetzelfde formaat in de
+subdirectory kubus/ bewaard worden, zodat het dashboard ze niet bij elke start
+opnieuw hoeft uit te rekenen.
+
+Met prerender.py kunnen ook alle figuren vooraf gemaakt worden, die staan als
+plotly JSON in figuren.zip.
+
+publiceer() schrijft een nieuwe versie (kolommen, metadata en kubus/) in een
+eigen directory versies/<versie> en zet daarna in een keer het bestand HUIDIG
+om naar die versie. Een dashboard dat de vorige versie gememory-mapt heeft,
+leest dus nooit een mengsel van twee versies. huidige_map() geeft de directory
+van de huidige versie; een directory zonder HUIDIG (zoals schrijf_kolommen die
+schrijft) wordt zelf gebruikt.
+
+Een CSV blijft mogelijk als export, en lees() kan beide formaten aan.
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+import docenten as d
+
+METADATA = "metadata.json"
+# Subdirectory met de bewaarde aggregaten voor het dashboard
+KUBUS = "kubus"
+# Vooraf gemaakte figuren (prerender.py), als plotly JSON
+FIGUREN = "figuren.zip"
+# Bij publiceer: de versies elk in een eigen directory, en welke de huidige is
+VERSIES = "versies"
+HUIDIG = "HUIDIG"
+
+
+def schrijf_kolommen(df, pad, data_tm=None, sleutel_id=None):
+    """Schrijf df (output van preprocess) kolomsgewijs naar de directory pad
+    en geef de metadata terug.
+
+    data_tm ("JJJJ-MM") is de maand t/m wanneer de data bijgewerkt is, standaard
+    de laatste maand in de data. sleutel_id (docenten.sleutel_id) legt vast met
+    welke sleutel de persnrs gehasht zijn.
+    """
+    meta = kerngegevens(df)
+    if data_tm:
+        meta["data_tm"] = data_tm
+    if sleutel_id:
+        meta["sleutel_id"] = sleutel_id
+    return _schrijf_tabel(df, pad, meta)
+
+
+def _schrijf_tabel(df, pad, extra):
+    os.makedirs(pad, exist_ok=True)
+    df = df.reset_index(drop=True)
+
+    meta = {"rijen": len(df), "kolommen": [], "dtypes": {}, "categorieen": {}}
+    versie = hashlib.sha1()
+    for kolom in df.columns:
+        waarden = df[kolom]
+        if isinstance(waarden.dtype, pd.CategoricalDtype):
+            meta["categorieen"][kolom] = [str(c) for c in waarden.cat.categories]
+            array = waarden.cat.codes.to_numpy()
+            meta["dtypes"][kolom] = "category"
+        elif waarden.dtype == object:
+            # Overige tekst als vaste breedte unicode, dan blijft mmap mogelijk
+            array = waarden.to_numpy().astype(str)
+            meta["dtypes"][kolom] = "str"
+        else:
+            array = waarden.to_numpy()
+            meta["dtypes"][kolom] = str(array.dtype)
+
+        _vervang(
+            os.path.join(pad, f"{kolom}.npy"),
+            lambda f: np.save(f, array, allow_pickle=False),
+        )
+        meta["kolommen"].append(kolom)
+        versie.update(kolom.encode())
+        versie.update(array.tobytes())
+        versie.update(json.dumps(meta["categorieen"].get(kolom)).encode())
+
+    meta["versie"] = versie.hexdigest()[:12]
+    meta.update(extra)
+
+    # Als laatste: wie de metadata leest, vindt alle kolommen van deze versie
+    _vervang(
+        os.path.join(pad, METADATA),
+        lambda f: f.write(json.dumps(meta, indent=1).encode()),
+    )
+
+    return meta
+
+
+def _vervang(bestand, schrijf):
+    """Schrijf bestand via een tijdelijk bestand en vervang het pas daarna. Een
+    dashboard dat de oude versie gememory-mapt heeft, houdt zo het oude bestand
+    (zie herlaad in het dashboard), in plaats van een half overschreven."""
+    with open(bestand + ".tmp", "wb") as f:
+        schrijf(f)
+    os.replace(bestand + ".tmp", bestand)
+
+
+def kerngegevens(df):
+    """Gegevens over de dataset die het dashboard nodig heeft zonder de data zelf."""
+    laatste = int((df["Kalenderjaar"].astype("int32") * 12 + df["maand"] - 1).max())
+    return {
+        "jaren": sorted(int(j) for j in pd.unique(df["Kalenderjaar"])),
+        "functies": sorted(str(f) for f in pd.unique(df["Functie"])),
+        "organisaties": sorted(str(o) for o in pd.unique(df["Organisatie"])),
+        "datums": list(d.datum_labels(np.unique(df["Datum"]))),
+        "data_tm": f"{laatste // 12}-{laatste % 12 + 1:02d}",
+    }
+
+
+def schrijf_kubus(kubus, pad, versie):
+    """Bewaar de aggregaten uit docenten.bouw_kubus naast de data in pad,
+    voor de dataversie versie."""
+    for naam, tabel in kubus.items():
+        _schrijf_tabel(tabel, os.path.join(pad, KUBUS, naam), {"data_versie": versie})
+
+
+def lees_kubus(pad, versie, mmap=True):
+    """Lees de met schrijf_kubus bewaarde aggregaten in. Geeft None als ze er niet
+    zijn of bij een andere versie van de data horen."""
+    kubus = {}
+    for naam in d.KUBUS_SLEUTELS:
+        tabel = os.path.join(pad, KUBUS, naam)
+        if not os.path.exists(os.path.join(tabel, METADATA)):
+            return None
+        kubus[naam], meta = lees_kolommen(tabel, mmap=mmap)
+        if meta["data_versie"] != versie:
+            return None
+    return kubus
+
+
+def publiceer(df, kubus, pad, data_tm=None, sleutel_id=None, bewaar=2):
+    """Schrijf df (output van preprocess) en de aggregaten (docenten.bouw_kubus)
+    als nieuwe versie in pad/versies/<versie> en maak die daarna de huidige.
+    Geeft de metadata terug.
+
+    Alles komt eerst in een tijdelijke directory, die pas compleet hernoemd
+    wordt; daarna wordt HUIDIG in een keer vervangen. Twee publicaties tegelijk
+    schrijven elk in hun eigen directory. Van de oudere versies blijven de
+    laatste bewaar staan (een dashboard kan ze nog gememory-mapt hebben).
+    """
+    versies = os.path.join(pad, VERSIES)
+    os.makedirs(versies, exist_ok=True)
+    tijdelijk = tempfile.mkdtemp(prefix=".nieuw-", dir=versies)
+    try:
+        meta = schrijf_kolommen(df, tijdelijk, data_tm=data_tm, sleutel_id=sleutel_id)
+        schrijf_kubus(kubus, tijdelijk, meta["versie"])
+        doel = os.path.join(versies, meta["versie"])
+        if os.path.isdir(doel):
+            # Deze versie (dezelfde inhoud) is er al
+            shutil.rmtree(tijdelijk)
+        else:
+            os.rename(tijdelijk, doel)
+    except BaseException:
+        shutil.rmtree(tijdelijk, ignore_errors=True)
+        raise
+
+    _vervang(os.path.join(pad, HUIDIG), lambda f: f.write(meta["versie"].encode()))
+    _ruim_op(versies, meta["versie"], bewaar)
+    return meta
+
+
+def _ruim_op(versies, huidig, bewaar):
+    """Verwijder alle versies behalve de huidige en de laatste bewaar andere.
+    Directories die nog geschreven worden (.nieuw-*) blijven staan."""
+    oud = [
+        os.path.join(versies, naam)
+        for naam in os.listdir(versies)
+        if not naam.startswith(".") and naam != huidig
+    ]
+    oud.sort(key=os.path.getmtime, reverse=True)
+    for directory in oud[bewaar:]:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def huidige_map(pad):
+    """De directory van de huidige versie van de data in pad: met publiceer
+    geschreven is dat de versie in pad/HUIDIG, anders pad zelf (ook een CSV)."""
+    try:
+        with open(os.path.join(pad, HUIDIG)) as f:
+            return os.path.join(pad, VERSIES, f.read().strip())
+    except (FileNotFoundError, NotADirectoryError):
+        return pad
+
+
+def lees_metadata(pad):
+    with open(os.path.join(pad, METADATA)) as f:
+        return json.load(f)
+
+
+def lees_kolommen(pad, mmap=True):
+    """Lees een met schrijf_kolommen geschreven directory in.
+
+    Met mmap=True worden de numerieke kolommen en de categorie-codes direct
+    vanaf schijf gebruikt (alleen-lezen), zonder ze in het geheugen te kopieren.
+    Geeft (df, metadata).
+    """
+    meta = lees_metadata(pad)
+    kolommen = {}
+    for kolom in meta["kolommen"]:
+        array = np.load(
+            os.path.join(pad, f"{kolom}.npy"), mmap_mode="r" if mmap else None
+        )
+        if kolom in meta["categorieen"]:
+            kolommen[kolom] = pd.Categorical.from_codes(
+                array, categories=meta["categorieen"][kolom], ordered=True
+            )
+        elif meta["dtypes"][kolom] == "str":
+            kolommen[kolom] = array.astype(object)
+        else:
+            kolommen[kolom] = array
+
+    # copy=False: geen consolidatie van kolommen, dus ook geen kopie van de mmap
+    return pd.DataFrame(kolommen, copy=False), meta
+
+
+def lees_csv(pad):
+    """Lees een CSV export in, in dezelfde compacte representatie als het kolomformaat."""
+    df = d.compact(pd.read_csv(pad, index_col=0))
+
+    with open(pad, "rb") as f:
+        versie = hashlib.sha1(f.read()).hexdigest()[:12]
+
+    meta = {"rijen": len(df), "versie": versie}
+    meta.update(kerngegevens(df))
+    return df, meta
+
+
+def lees(pad, mmap=True):
+    """Lees de dataset in, als kolom-directory of als CSV. Geeft (df, metadata)."""
+    if os.path.isdir(pad):
+        return lees_kolommen(pad, mmap=mmap)
+    return lees_csv(pad)
+
+
+def figuur_sleutel(figuur, *invoer):
+    """Naam van een figuur in figuren.zip, bijv. "graph_vast/Docent 4/2021-2022/True"."""
+    delen = [figuur]
+    for waarde in invoer:
+        if isinstance(waarde, (list, tuple)):
+            waarde = "-".join(str(w) for w in waarde)
+        delen.append(str(waarde))
+    return "/".join(delen)
+
+
+def bron_versie(*bestanden):
+    """Versie van de code in bestanden, zodat vooraf gemaakte figuren na een
+    wijziging in de plots niet meer gebruikt worden."""
+    versie = hashlib.sha1()
+    for bestand in bestanden:
+        with open(bestand, "rb") as f:
+            versie.update(f.read())
+    return versie.hexdigest()[:12]
+
+
+def schrijf_figuren(figuren, pad, versie):
+    """Bewaar figuren (dict van figuur_sleutel naar plotly JSON) naast de data in pad,
+    voor de dataversie versie."""
+    doel = os.path.join(pad, FIGUREN)
+    with zipfile.ZipFile(doel + ".tmp", "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("versie", versie)
+        for sleutel, figuur in figuren.items():
+            z.writestr(f"{sleutel}.json", figuur)
+    # Pas vervangen als alles geschreven is
+    os.replace(doel + ".tmp", doel)
+
+
+def lees_figuren(pad, versie):
+    """Lees de met schrijf_figuren bewaarde figuren in, als dict van figuur_sleutel
+    naar JSON (bytes). Leeg als ze er niet zijn of bij een andere versie horen."""
+    bestand = os.path.join(pad, FIGUREN)
+    if not os.path.isfile(bestand):
+        return {}
+    with zipfile.ZipFile(bestand) as z:
+        if z.read("versie").decode() != versie:
+            return {}
+        return {
+            naam[: -len(".json")]: z.read(naam)
+            for naam in z.namelist()
+            if naam.endswith(".json")
+        }
+
+
+def lees_export_chunks(pad, chunk_rijen=50_000):
+    """Lees een export uit UvA Data (xlsx of csv) in stukken van chunk_rijen regels,
+    zonder het hele bestand in het geheugen te laden. Voor docenten.preprocess_stroom.
+    """
+    if pad.endswith(".csv"):
+        yield from pd.read_csv(pad, chunksize=chunk_rijen)
+        return
+
+    from openpyxl import load_workbook
+
+    werkboek = load_workbook(pad, read_only=True, data_only=True)
+    rijen = werkboek.active.iter_rows(values_only=True)
+    kolommen = [str(kolom) for kolom in next(rijen)]
+    while True:
+        chunk = list(itertools.islice(rijen, chunk_rijen))
+        if not chunk:
+            break
+        chunk = pd.DataFrame(chunk, columns=kolommen)
+        # Lege cellen komen als None, maak er NaN van
+        chunk[d.MAANDEN] = chunk[d.MAANDEN].astype("float64")
+        yield chunk
+    werkboek.close()
+
+
+def schrijf_csv(df, pad):
+    """Exporteer naar CSV, met Datum weer als leesbaar label."""
+    df.assign(Datum=d.datum_labels(df["Datum"])).to_csv(pad)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Zet een CSV export om naar het kolomformaat van het dashboard."
+    )
+    parser.add_argument(
+        "csv", help="bestaande CSV, bijv. data/Docenten_2020-2022_hashed.csv"
+    )
+    parser.add_argument("uit", help="directory voor het kolomformaat")
+    parser.add_argument(
+        "--tm", help="data bijgewerkt t/m deze maand (JJJJ-MM), standaard de laatste"
+    )
+    parser.add_argument(
+        "--plat",
+        action="store_true",
+        help="schrijf direct in de directory, zonder versies/ en HUIDIG (zoals de "
+        "datasets in de repo)",
+    )
+    args = parser.parse_args()
+
+    df, _ = lees_csv(args.csv)
+    if args.plat:
+        meta = schrijf_kolommen(df, args.uit, data_tm=args.tm)
+        schrijf_kubus(d.bouw_kubus(df), args.uit, meta["versie"])
+    else:
+        meta = publiceer(df, d.bouw_kubus(df), args.uit, data_tm=args.tm)
+    print(f"{meta['rijen']} rijen geschreven naar {args.uit}, versie {meta['versie']}")
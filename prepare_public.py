@@ -1,11 +1,158 @@
+import argparse
+import resource
 import pandas as pd
-from docenten import hash_nr, preprocess
+from docenten import (
+    bouw_kubus,
+    hash_nr,
+    na_maand,
+    preprocess,
+    preprocess_parallel,
+    preprocess_stroom,
+    sleutel_id,
+    sorteer,
+    voeg_maanden_toe,
+    werk_kubus_bij,
+)
+import instellingen
+import opslag
 
 datapath = "/home/marcel/work/Laura/Docentenbeleid/Data/"
 
-df_raw = pd.read_excel(datapath + "Docenten_2020-2022_20221206.xlsx")
-df = preprocess(df_raw)
+# Ruime schatting van het geheugen per regel van de export in pandas,
+# inclusief de tussenresultaten van de aggregatie
+BYTES_PER_EXPORTREGEL = 2000
 
-df = hash_nr(df, "persnr")
+parser = argparse.ArgumentParser(
+    description="Maak de gehashte dataset voor het dashboard uit een UvA Data export."
+)
+parser.add_argument(
+    "--export",
+    default=datapath + "Docenten_2020-2022_20221206.xlsx",
+    help="de Excel (of CSV) export uit UvA Data",
+)
+parser.add_argument(
+    "--uit",
+    default="data/Docenten_2020-2022_hashed",
+    help="directory voor het kolomformaat dat het dashboard inleest",
+)
+parser.add_argument(
+    "--csv",
+    nargs="?",
+    const="data/Docenten_2020-2022_hashed.csv",
+    help="exporteer ook naar CSV (optioneel met pad)",
+)
+parser.add_argument(
+    "--geheugen",
+    type=int,
+    help="verwerk de export in stukken, met ongeveer zoveel MB geheugen per stuk",
+)
+parser.add_argument(
+    "--partities",
+    type=int,
+    default=16,
+    help="aantal partities (op persnr) bij verwerking in stukken",
+)
+parser.add_argument(
+    "--werkmap", help="directory voor tussenbestanden bij verwerking in stukken"
+)
+parser.add_argument(
+    "--processen",
+    type=int,
+    help="verwerk de export per Organisatie, verdeeld over zoveel processen",
+)
+parser.add_argument(
+    "--toevoegen",
+    action="store_true",
+    help="verwerk alleen de maanden na data_tm van de bestaande dataset in --uit "
+    "en voeg die toe, in plaats van alles opnieuw te maken",
+)
+parser.add_argument(
+    "--plat",
+    action="store_true",
+    help="schrijf direct in --uit, zonder versies/ en HUIDIG (zoals de datasets in "
+    "de repo); dan niet in de directory van een draaiend dashboard",
+)
+parser.add_argument(
+    "--tm",
+    help="de data is bijgewerkt t/m deze maand (JJJJ-MM), "
+    "standaard de laatste maand in de data",
+)
+args = parser.parse_args()
 
-df.to_csv("data/Docenten_2020-2022_hashed.csv")
+if args.geheugen and args.processen:
+    parser.error("--processen gaat niet samen met --geheugen")
+if not instellingen.HASH_SLEUTEL:
+    parser.error("zet DOCENTEN_HASH_SLEUTEL, de sleutel voor het hashen van de persnrs")
+
+if args.toevoegen:
+    huidige_map = opslag.huidige_map(args.uit)
+    bestaand, metadata = opslag.lees(huidige_map, mmap=False)
+    # Alleen met dezelfde sleutel komen de persnrs overeen met de vorige levering
+    if metadata.get("sleutel_id") != sleutel_id(instellingen.HASH_SLEUTEL):
+        parser.error(
+            f"{args.uit} is met een andere sleutel gehasht, maak hem eerst opnieuw"
+        )
+    jaar, maand = (int(x) for x in metadata["data_tm"].split("-"))
+
+    def alleen_nieuw(df_raw):
+        return na_maand(df_raw, jaar, maand)
+
+else:
+
+    def alleen_nieuw(df_raw):
+        return df_raw
+
+
+if args.geheugen:
+    chunk_rijen = max(1000, args.geheugen * 2**20 // BYTES_PER_EXPORTREGEL)
+    chunks = opslag.lees_export_chunks(args.export, chunk_rijen=chunk_rijen)
+    df = preprocess_stroom(
+        map(alleen_nieuw, chunks), partities=args.partities, werkmap=args.werkmap
+    )
+else:
+    if args.export.endswith(".csv"):
+        df_raw = pd.read_csv(args.export)
+    else:
+        df_raw = pd.read_excel(args.export)
+    if args.processen:
+        df = preprocess_parallel(alleen_nieuw(df_raw), processen=args.processen)
+    else:
+        df = preprocess(alleen_nieuw(df_raw))
+
+# Op het gehashte persnr sorteren, zoals voeg_maanden_toe
+df = sorteer(hash_nr(df, "persnr", instellingen.HASH_SLEUTEL))
+
+if args.toevoegen:
+    # Alleen de kwartalen met nieuwe (of vervangen) maanden opnieuw aggregeren
+    df, datums = voeg_maanden_toe(bestaand, df, jaar, maand)
+    kubus = opslag.lees_kubus(huidige_map, metadata["versie"], mmap=False)
+    if kubus is None:
+        kubus = bouw_kubus(df)
+    else:
+        kubus = werk_kubus_bij(kubus, df, datums)
+    print(f"Toegevoegd na {metadata['data_tm']}, {len(datums)} kwartalen bijgewerkt")
+else:
+    kubus = bouw_kubus(df)
+
+if args.plat:
+    metadata = opslag.schrijf_kolommen(
+        df, args.uit, data_tm=args.tm, sleutel_id=sleutel_id(instellingen.HASH_SLEUTEL)
+    )
+    opslag.schrijf_kubus(kubus, args.uit, metadata["versie"])
+else:
+    # Als nieuwe versie in args.uit/versies, daarna in een keer de huidige
+    metadata = opslag.publiceer(
+        df,
+        kubus,
+        args.uit,
+        data_tm=args.tm,
+        sleutel_id=sleutel_id(instellingen.HASH_SLEUTEL),
+    )
+if args.csv:
+    opslag.schrijf_csv(df, args.csv)
+
+# ru_maxrss is in kB op Linux
+piek = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(f"{len(df)} rijen t/m {metadata['data_tm']} geschreven naar {args.uit}")
+print(f"Piekgeheugen: {piek:.0f} MB", end="")
+print(f" (budget {args.geheugen} MB per stuk)" if args.geheugen else "")
@@ -0,0 +1,76 @@
+"""Maak vooraf alle figuren die het dashboard kan tonen.
+
+Er zijn maar weinig combinaties van invoer mogelijk (Functie x de head
+count/FTE switch, het tijdvak filtert de browser), dus na prepare_public.py worden ze hier allemaal gemaakt
+en als plotly JSON in figuren.zip naast de data bewaard. Het dashboard geeft die
+direct terug en rekent alleen nog live voor combinaties die er niet in staan.
+
+De figuren worden verdeeld over DOCENTEN_PRERENDER_PROCESSEN processen; per
+figuur wordt de duur gerapporteerd (totaal en de traagste combinatie).
+
+Gebruik: python prerender.py (de dataset uit DOCENTEN_DATA, zie instellingen.py)
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import os
+import time
+
+import instellingen
+import opslag
+import dashboard_docentenbeleid as dashboard
+
+
+def combinaties(stand):
+    """Alle waarden die elke invoer in het dashboard kan hebben. Het tijdvak
+    filtert de browser, de server maakt alleen figuren over de hele periode."""
+    return {
+        "Functie": [f for f in stand.metadata["functies"] if f in dashboard.prom_map],
+        "jaren": [stand.volledig],
+        "ftehc": [False, True],
+    }
+
+
+def maak_figuur(taak):
+    """Het figuur als plotly JSON, met hoe lang het maken duurde. In een proces
+    van de pool: de data is er al (fork) of wordt door laad() ingelezen."""
+    naam, argumenten = taak
+    maak, _ = dashboard.FIGUREN[naam]
+    start = time.perf_counter()
+    figuur = maak(*argumenten).to_json()
+    return figuur, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    if not os.path.isdir(instellingen.DATAPAD):
+        raise SystemExit(f"{instellingen.DATAPAD} is geen directory in kolomformaat")
+
+    start = time.perf_counter()
+    stand = dashboard.laad()
+    waarden = combinaties(stand)
+    taken = [
+        (naam, argumenten)
+        for naam, (_, afhankelijk) in dashboard.FIGUREN.items()
+        for argumenten in itertools.product(*(waarden[a] for a in afhankelijk))
+    ]
+    if instellingen.PRERENDER_PROCESSEN > 1:
+        with ProcessPoolExecutor(instellingen.PRERENDER_PROCESSEN) as pool:
+            resultaten = list(pool.map(maak_figuur, taken))
+    else:
+        resultaten = [maak_figuur(taak) for taak in taken]
+
+    figuren = {}
+    duur = {}
+    for (naam, argumenten), (figuur, seconden) in zip(taken, resultaten):
+        figuren[opslag.figuur_sleutel(naam, *argumenten)] = figuur
+        duur.setdefault(naam, []).append(seconden)
+    for naam, seconden in duur.items():
+        print(f"{naam}: {sum(seconden):.2f} s, traagste {max(seconden):.2f} s")
+
+    # Naast de versie van de data waarvan ze gemaakt zijn
+    opslag.schrijf_figuren(figuren, stand.map, stand.figuren_versie)
+    grootte = os.path.getsize(os.path.join(stand.map, opslag.FIGUREN))
+    print(
+        f"{len(figuren)} figuren in {time.perf_counter() - start:.1f} s, "
+        f"{grootte / 2**20:.1f} MB, versie {stand.figuren_versie}"
+    )
@@ -0,0 +1,103 @@
+"""Profileren van een callback van het dashboard, op verzoek en zonder te deployen.
+
+Aan te zetten op twee manieren (zie instellingen.py):
+- DOCENTEN_PROFIEL=1: elke callback wordt geprofileerd
+- per gebruiker: open het dashboard met ?profiel=<token>, ondertekend met
+  DOCENTEN_PROFIEL_SLEUTEL (python profiel.py token). De callbacks vanuit die
+  pagina worden dan geprofileerd, tot het token verloopt.
+
+Een geprofileerde callback rekent het figuur live uit, zonder de caches en de
+voorraad van prerender.py, anders valt er niets te zien. Het profiel (cProfile)
+komt als .pstats in DOCENTEN_PROFIEL_MAP, met ernaast een .json met het figuur,
+de invoer en de duur. Een .pstats kan met snakeviz of flameprof als flamegraph
+bekeken worden, of met: python profiel.py toon <bestand.pstats>
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+from urllib.parse import parse_qs, urlparse
+
+import instellingen
+
+# Salt van de ondertekening, zodat een token alleen hiervoor geldt
+SALT = "docenten-profiel"
+
+
+def _serializer():
+    from itsdangerous import URLSafeTimedSerializer
+
+    return URLSafeTimedSerializer(instellingen.PROFIEL_SLEUTEL, salt=SALT)
+
+
+def token():
+    """Een ondertekend token voor ?profiel=..."""
+    if not instellingen.PROFIEL_SLEUTEL:
+        raise SystemExit("Zet eerst DOCENTEN_PROFIEL_SLEUTEL")
+    return _serializer().dumps("profiel")
+
+
+def _geldig(waarde):
+    from itsdangerous import BadSignature
+
+    try:
+        _serializer().loads(waarde, max_age=instellingen.PROFIEL_GELDIG)
+    except BadSignature:
+        return False
+    return True
+
+
+def actief():
+    """Of de callback die nu draait geprofileerd moet worden."""
+    if instellingen.PROFIEL:
+        return True
+    if not instellingen.PROFIEL_SLEUTEL:
+        return False
+
+    from flask import has_request_context, request
+
+    if not has_request_context():
+        return False
+    # Callbacks zijn POSTs van Dash zelf, de ?profiel=... staat in de URL van
+    # de pagina, en die stuurt de browser mee als Referer
+    waarden = parse_qs(urlparse(request.referrer or "").query).get("profiel")
+    return bool(waarden) and _geldig(waarden[0])
+
+
+def profileer(naam, invoer, functie):
+    """Voer functie() uit onder cProfile en bewaar het profiel met de invoer."""
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    resultaat = profiler.runcall(functie)
+    duur = time.perf_counter() - start
+
+    os.makedirs(instellingen.PROFIEL_MAP, exist_ok=True)
+    basis = os.path.join(
+        instellingen.PROFIEL_MAP,
+        f"{time.strftime('%Y%m%d-%H%M%S')}-{naam}-{os.getpid()}",
+    )
+    profiler.dump_stats(basis + ".pstats")
+    with open(basis + ".json", "w") as f:
+        json.dump({"figuur": naam, "invoer": invoer, "seconden": duur}, f, indent=2)
+    return resultaat
+
+
+def toon(bestand, aantal=25):
+    """De duurste functies (cumulatief) uit een profiel, met de invoer erbij."""
+    invoer = os.path.splitext(bestand)[0] + ".json"
+    if os.path.exists(invoer):
+        with open(invoer) as f:
+            print(json.dumps(json.load(f)))
+    pstats.Stats(bestand).sort_stats("cumulative").print_stats(aantal)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["token"]:
+        print(token())
+    elif sys.argv[1:2] == ["toon"] and len(sys.argv) == 3:
+        toon(sys.argv[2])
+    else:
+        raise SystemExit("Gebruik: python profiel.py token | toon <bestand.pstats>")